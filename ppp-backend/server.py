@@ -0,0 +1,482 @@
+import os
+import sys
+import io
+import json
+import time
+import gzip
+import zlib
+import sqlite3
+import secrets
+import logging
+import argparse
+import math
+import re
+import threading
+import xml.etree.ElementTree as ET
+from urllib.parse import urlencode
+from email.utils import formatdate, parsedate_to_datetime
+import requests
+from flask import Flask, Response, g, jsonify, request
+from waitress import serve
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Configuration
+DB_PATH = os.getenv("DB_PATH", "ppp.db")
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "5000"))
+THREADS = int(os.getenv("THREADS", "32"))  # Long-polling workers each hold a thread for up to MAX_LONG_POLL_SECONDS
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", str(12 * 60 * 60)))  # Episodes are reassigned if no results arrive within 12 hours
+MAX_LONG_POLL_SECONDS = 60  # Longest a GET /episode?wait=... is held open
+PAGE_SIZE = 100  # Default and maximum page size of GET /episodes are PAGE_SIZE and 10 * PAGE_SIZE
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "200"))  # Limit for a decompressed results upload
+TOO_LONG_RETRY_MINUTES = int(os.getenv("TOO_LONG_RETRY_MINUTES", "60"))  # Episodes a worker released as too long wait this long before they are leased again
+FEED_REFRESH_MINUTES = int(os.getenv("FEED_REFRESH_MINUTES", "0"))  # Check the feeds for new episodes this often, 0 disables it
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feeds (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    podcast_name TEXT NOT NULL,
+    last_checked_at REAL
+);
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY,
+    guid TEXT NOT NULL UNIQUE,
+    podcast_name TEXT NOT NULL,
+    episode_title TEXT,
+    file_url TEXT NOT NULL,
+    published_at TEXT,
+    status TEXT NOT NULL DEFAULT 'unprocessed',
+    token TEXT,
+    token_created_at REAL,
+    lease_expires_at REAL NOT NULL DEFAULT 0,
+    processed_by TEXT,
+    processed_at REAL
+);
+-- Leasing walks (status, lease_expires_at), the listings use the rowid that every index carries
+CREATE INDEX IF NOT EXISTS episodes_lease ON episodes (status, lease_expires_at);
+DROP INDEX IF EXISTS episodes_status;  -- Covered by episodes_lease
+CREATE INDEX IF NOT EXISTS episodes_podcast ON episodes (podcast_name);
+CREATE TABLE IF NOT EXISTS results (
+    episode_id INTEGER PRIMARY KEY REFERENCES episodes (id),
+    nickname TEXT,
+    received_at REAL NOT NULL,
+    body BLOB NOT NULL  -- gzip compressed JSON, sent as is to clients that accept gzip
+);
+CREATE TABLE IF NOT EXISTS tallies (
+    nickname TEXT PRIMARY KEY,
+    processed INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Full-text index over the whisper segments of all results, filled as results arrive.
+# The prefix indexes keep queries like "frog*" from scanning every term that starts with it.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE segments USING fts5 (
+    text,
+    episode_id UNINDEXED,
+    start_ms UNINDEXED,
+    end_ms UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+"""
+MAX_SEARCH_RESULTS = 100
+
+app = Flask(__name__)
+# Refuse oversized bodies before they are read into memory, compressed uploads are never larger than decompressed ones
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+
+# Woken up when episodes become available, so long-polling workers don't have to wait for the next check
+episodes_available = threading.Condition()
+
+def connect():
+    # Autocommit, transactions are started explicitly where they are needed
+    db = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")
+    db.execute("PRAGMA busy_timeout = 30000")
+    return db
+
+def init_db():
+    db = connect()
+    db.executescript(SCHEMA)
+    if db.execute("SELECT 1 FROM sqlite_master WHERE name = 'segments'").fetchone() is None:
+        # Databases from before the search index get their results indexed once
+        db.executescript(SEARCH_SCHEMA)
+        # Paged by episode_id, so only a page of result bodies is in memory at a time
+        db.execute("BEGIN IMMEDIATE")
+        last_id = -1
+        while True:
+            rows = db.execute("SELECT episode_id, body FROM results WHERE episode_id > ? ORDER BY episode_id LIMIT ?",
+                              (last_id, PAGE_SIZE)).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                index_segments(db, row['episode_id'], json.loads(gzip.decompress(row['body']))['json_data'])
+            last_id = rows[-1]['episode_id']
+        db.execute("COMMIT")
+    db.close()
+
+def get_db():
+    if 'db' not in g:
+        g.db = connect()
+    return g.db
+
+@app.teardown_appcontext
+def close_db(exception):
+    db = g.pop('db', None)
+    if db is not None:
+        db.close()
+
+def episode_json(row):
+    return {
+        'guid': row['guid'],
+        'podcast_name': row['podcast_name'],
+        'episode_title': row['episode_title'],
+        'file_url': row['file_url'],
+        'published_at': row['published_at'],
+        'status': row['status'],
+    }
+
+def lease_episode(db):
+    # BEGIN IMMEDIATE takes the write lock up front, so two workers can't lease the same episode.
+    # Never leased episodes have lease_expires_at 0 and come first, then the ones whose lease ran out.
+    now = time.time()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute("SELECT * FROM episodes WHERE status = 'unprocessed' AND lease_expires_at <= ? "
+                         "ORDER BY lease_expires_at LIMIT 1", (now,)).fetchone()
+        if row is None:
+            db.execute("COMMIT")
+            return None
+        if row['token'] is not None:
+            logging.info(f"Lease for episode {row['guid']} expired, reassigning it")
+        token = secrets.token_urlsafe(16)
+        db.execute("UPDATE episodes SET token = ?, token_created_at = ?, lease_expires_at = ? WHERE id = ?",
+                   (token, now, now + LEASE_SECONDS, row['id']))
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    episode = episode_json(row)
+    episode.update({'token': token, 'token_created_at': formatdate(now, usegmt=True)})
+    return episode
+
+@app.get("/episode")
+def get_episode():
+    # With ?wait=N the request is held open for up to N seconds until an episode can be leased
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        wait = math.nan
+    if not math.isfinite(wait):
+        return jsonify({'error': 'wait must be a number'}), 400
+    wait = min(max(wait, 0), MAX_LONG_POLL_SECONDS)
+    deadline = time.monotonic() + wait
+    db = get_db()
+    while True:
+        episode = lease_episode(db)
+        if episode is not None:
+            logging.info(f"Leased episode {episode['guid']} ({episode['podcast_name']}: {episode['episode_title']})")
+            return jsonify(episode)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return jsonify({'message': 'No unprocessed episodes available'}), 404
+        # Feeds refreshed from the command line don't notify us, so look again every few seconds
+        with episodes_available:
+            episodes_available.wait(min(remaining, 5))
+
+@app.post("/release")
+def release_episode():
+    data = request.get_json(silent=True) or {}
+    # Episodes too long for the releasing worker go behind the rest of the queue, otherwise the same worker gets them right back
+    not_before = time.time() + TOO_LONG_RETRY_MINUTES * 60 if data.get('reason') == "too_long" else 0
+    db = get_db()
+    cursor = db.execute("UPDATE episodes SET token = NULL, token_created_at = NULL, lease_expires_at = ? "
+                        "WHERE guid = ? AND token = ? AND status = 'unprocessed'", (not_before, data.get('guid'), data.get('token')))
+    if not cursor.rowcount:
+        return jsonify({'error': 'No matching lease'}), 409
+    logging.info(f"Episode {data.get('guid')} released ({data.get('reason', 'no reason given')})")
+    with episodes_available:
+        episodes_available.notify()
+    return jsonify({'message': 'Released'})
+
+def decode_body(data, content_encoding):
+    # Decompress a gzip/zstd upload, refusing anything that grows beyond MAX_UPLOAD_MB
+    limit = MAX_UPLOAD_MB * 1024 * 1024
+    try:
+        if content_encoding in ("", "identity"):
+            decoded = data
+        elif content_encoding == "gzip":
+            decoded = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data, limit + 1)
+        elif content_encoding == "zstd" and zstandard is not None:
+            decoded = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read(limit + 1)
+        else:
+            raise ValueError(f"Unsupported Content-Encoding {content_encoding}")
+    except (zlib.error, *((zstandard.ZstdError,) if zstandard else ())) as e:
+        raise ValueError(f"Could not decompress the upload: {e}")
+    if len(decoded) > limit:
+        raise OverflowError(f"Upload is larger than {MAX_UPLOAD_MB} MB")
+    return decoded
+
+def format_timestamp(ms):
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+def rebuild_text_results(json_data):
+    # Workers with UPLOAD_JSON_ONLY=1 only send whisper.cpp's JSON, txt and SRT are built from its segments
+    segments = json.loads(json_data).get('transcription', [])
+    transcript = "".join(f"{segment['text']}\n" for segment in segments)
+    srt_data = "".join(f"{i + 1}\n{format_timestamp(segment['offsets']['from'])} --> {format_timestamp(segment['offsets']['to'])}\n"
+                       f"{segment['text']}\n\n" for i, segment in enumerate(segments))
+    return transcript, srt_data
+
+def index_segments(db, episode_id, json_data):
+    try:
+        segments = json.loads(json_data).get('transcription', [])
+        rows = [(segment['text'].strip(), episode_id, segment['offsets']['from'], segment['offsets']['to'])
+                for segment in segments if segment['text'].strip()]
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        logging.warning(f"Could not index the segments of episode {episode_id}: {e}")
+        return
+    db.executemany("INSERT INTO segments (text, episode_id, start_ms, end_ms) VALUES (?, ?, ?, ?)", rows)
+
+@app.post("/results")
+def post_results():
+    try:
+        data = json.loads(decode_body(request.get_data(), request.headers.get('Content-Encoding', '').lower()))
+        results = data['results']
+        json_data = results['json_data']
+        if 'transcript' not in results or 'srt_data' not in results:
+            results['transcript'], results['srt_data'] = rebuild_text_results(json_data)
+    except OverflowError as e:
+        return jsonify({'error': str(e)}), 413
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': f"Invalid upload: {e}"}), 400
+
+    guid = data.get('guid')
+    nickname = (data.get('nickname') or "anonymous")[:100]
+    db = get_db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute("SELECT * FROM episodes WHERE guid = ?", (guid,)).fetchone()
+        if row is None:
+            db.execute("ROLLBACK")
+            return jsonify({'error': 'Unknown episode'}), 404
+        if row['status'] == 'processed':
+            db.execute("ROLLBACK")
+            return jsonify({'error': 'Episode was already processed'}), 409
+        if row['token'] is None or not secrets.compare_digest(row['token'], str(data.get('token'))):
+            db.execute("ROLLBACK")
+            return jsonify({'error': 'Invalid token'}), 403
+        body = dict(episode_json(row), status='processed', nickname=nickname,
+                    transcript=results['transcript'], json_data=json_data, srt_data=results['srt_data'])
+        db.execute("INSERT OR REPLACE INTO results (episode_id, nickname, received_at, body) VALUES (?, ?, ?, ?)",
+                   (row['id'], nickname, time.time(), gzip.compress(json.dumps(body).encode(), compresslevel=6)))
+        db.execute("UPDATE episodes SET status = 'processed', token = NULL, lease_expires_at = 0, processed_by = ?, processed_at = ? "
+                   "WHERE id = ?", (nickname, time.time(), row['id']))
+        index_segments(db, row['id'], json_data)
+        # Tallies are kept up to date here instead of being counted from the results on every request
+        db.execute("INSERT INTO tallies (nickname, processed) VALUES (?, 1) "
+                   "ON CONFLICT (nickname) DO UPDATE SET processed = processed + 1", (nickname,))
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    logging.info(f"Results for episode {guid} received from {nickname}")
+    return jsonify({'message': 'Results received'})
+
+@app.get("/episodes")
+def list_episodes():
+    # Cursor pagination: ?cursor= is the last id of the previous page, the next one is sent in the
+    # X-Next-Cursor and Link headers. The body stays a plain list of episodes.
+    status = request.args.get('status')
+    podcast = request.args.get('podcast')
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        limit = min(max(int(request.args.get('limit', PAGE_SIZE)), 1), 10 * PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'cursor and limit must be numbers'}), 400
+    if status not in (None, 'processed', 'unprocessed'):
+        return jsonify({'error': 'status must be processed or unprocessed'}), 400
+
+    query = "SELECT * FROM episodes WHERE id > ?"
+    params = [cursor]
+    if status:
+        # The unary + keeps SQLite from using episodes_lease, which would sort every episode with that status. Walking the ids stops after a page.
+        query += " AND +status = ?"
+        params.append(status)
+    if podcast:
+        query += " AND podcast_name = ?"
+        params.append(podcast)
+    rows = get_db().execute(query + " ORDER BY id LIMIT ?", params + [limit + 1]).fetchall()
+
+    response = jsonify([episode_json(row) for row in rows[:limit]])
+    if len(rows) > limit:
+        next_cursor = rows[limit - 1]['id']
+        next_args = dict(request.args, cursor=next_cursor, limit=limit)
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(next_args)}>; rel="next"'
+    return response
+
+@app.get("/results/<guid>")
+def get_results(guid):
+    row = get_db().execute("SELECT results.body FROM results JOIN episodes ON episodes.id = results.episode_id "
+                           "WHERE episodes.guid = ?", (guid,)).fetchone()
+    if row is None:
+        return jsonify({'error': 'No results for this episode'}), 404
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        return Response(row['body'], mimetype='application/json', headers={'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'})
+    return Response(gzip.decompress(row['body']), mimetype='application/json', headers={'Vary': 'Accept-Encoding'})
+
+@app.get("/tallies")
+def get_tallies():
+    rows = get_db().execute("SELECT nickname, processed FROM tallies ORDER BY processed DESC, nickname").fetchall()
+    return jsonify([dict(row) for row in rows])
+
+def fts_query(text):
+    # Turn a search box query into an FTS5 expression: words and "quoted phrases" must all match,
+    # a trailing * makes the word (or the last word of a phrase) a prefix. Everything else is dropped,
+    # so user input can't produce FTS5 syntax errors.
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*"?\*?)|(\S+)', text):
+        term = phrase or word
+        prefix = term.endswith("*")
+        tokens = re.findall(r"\w+", term)
+        if tokens:
+            terms.append(f'"{" ".join(tokens)}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+@app.get("/search")
+def search():
+    # Segments matching ?q=, each with the episode GUID and the segment start/end in milliseconds.
+    # Latest results come first, that lets FTS5 stop after one page even for the most common words.
+    # ?order=relevance ranks by bm25 instead, which has to score every match first.
+    query = fts_query(request.args.get('q', ''))
+    if not query:
+        return jsonify({'error': 'q must contain at least one word'}), 400
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        limit = min(max(int(request.args.get('limit', 20)), 1), MAX_SEARCH_RESULTS)
+    except ValueError:
+        return jsonify({'error': 'cursor and limit must be numbers'}), 400
+    relevance = request.args.get('order') == 'relevance'
+
+    sql = ("SELECT segments.rowid AS id, episodes.guid, episodes.podcast_name, episodes.episode_title, "
+           "segments.start_ms, segments.end_ms, segments.text "
+           "FROM segments JOIN episodes ON episodes.id = segments.episode_id WHERE segments MATCH ?")
+    params = [query]
+    if request.args.get('podcast'):
+        sql += " AND episodes.podcast_name = ?"
+        params.append(request.args['podcast'])
+    if cursor and not relevance:
+        sql += " AND segments.rowid < ?"
+        params.append(cursor)
+    sql += " ORDER BY segments.rank" if relevance else " ORDER BY segments.rowid DESC"
+    rows = get_db().execute(f"{sql} LIMIT ?", params + [limit + 1]).fetchall()
+
+    response = jsonify([{key: row[key] for key in row.keys() if key != 'id'} for row in rows[:limit]])
+    if len(rows) > limit and not relevance:
+        next_args = dict(request.args, cursor=rows[limit - 1]['id'], limit=limit)
+        response.headers['X-Next-Cursor'] = str(next_args['cursor'])
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(next_args)}>; rel="next"'
+    return response
+
+def parse_feed(xml_data):
+    # Episodes of an RSS feed as (guid, title, file_url, published_at), items without audio are skipped
+    channel = ET.fromstring(xml_data).find('channel')
+    podcast_name = (channel.findtext('title') or "").strip()
+    episodes = []
+    for item in channel.iter('item'):
+        enclosure = item.find('enclosure')
+        if enclosure is None or not enclosure.get('url'):
+            continue
+        file_url = enclosure.get('url')
+        published_at = item.findtext('pubDate')
+        try:
+            published_at = parsedate_to_datetime(published_at).isoformat()
+        except (TypeError, ValueError):
+            pass
+        episodes.append(((item.findtext('guid') or file_url).strip(), (item.findtext('title') or "").strip(), file_url, published_at))
+    return podcast_name, episodes
+
+def refresh_feed(db, feed):
+    response = requests.get(feed['url'], timeout=(10, 120))
+    response.raise_for_status()
+    _, episodes = parse_feed(response.content)
+    # Oldest first, so new ids (and the order of leasing) follow the publication order
+    episodes.reverse()
+    added = 0
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        for guid, title, file_url, published_at in episodes:
+            added += db.execute("INSERT OR IGNORE INTO episodes (guid, podcast_name, episode_title, file_url, published_at) "
+                                "VALUES (?, ?, ?, ?, ?)", (guid, feed['podcast_name'], title, file_url, published_at)).rowcount
+        db.execute("UPDATE feeds SET last_checked_at = ? WHERE id = ?", (time.time(), feed['id']))
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    logging.info(f"{feed['podcast_name']}: {len(episodes)} episodes in the feed, {added} new")
+    return added
+
+def refresh_feeds(db):
+    added = 0
+    for feed in db.execute("SELECT * FROM feeds ORDER BY id").fetchall():
+        try:
+            added += refresh_feed(db, feed)
+        except (requests.exceptions.RequestException, ET.ParseError, AttributeError) as e:
+            logging.warning(f"Could not refresh feed {feed['url']}: {e}")
+    if added:
+        with episodes_available:
+            episodes_available.notify_all()
+    return added
+
+def add_feed(db, url, podcast_name=None):
+    if not podcast_name:
+        response = requests.get(url, timeout=(10, 120))
+        response.raise_for_status()
+        podcast_name, _ = parse_feed(response.content)
+    db.execute("INSERT INTO feeds (url, podcast_name) VALUES (?, ?) ON CONFLICT (url) DO UPDATE SET podcast_name = excluded.podcast_name",
+               (url, podcast_name))
+    feed = db.execute("SELECT * FROM feeds WHERE url = ?", (url,)).fetchone()
+    logging.info(f"Added feed {url} as {podcast_name}")
+    return refresh_feed(db, feed)
+
+def refresh_feeds_periodically():
+    db = connect()
+    while True:
+        refresh_feeds(db)
+        time.sleep(FEED_REFRESH_MINUTES * 60)
+
+def main():
+    parser = argparse.ArgumentParser(description="Reference implementation of the PPP API")
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('serve', help="Run the API (default)")
+    add_feed_parser = commands.add_parser('add-feed', help="Add an RSS feed and queue its episodes")
+    add_feed_parser.add_argument('url')
+    add_feed_parser.add_argument('--name', help="Podcast name, defaults to the feed title")
+    commands.add_parser('refresh', help="Queue new episodes of all feeds")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == 'add-feed':
+        add_feed(connect(), args.url, args.name)
+    elif args.command == 'refresh':
+        refresh_feeds(connect())
+    else:
+        if FEED_REFRESH_MINUTES:
+            threading.Thread(target=refresh_feeds_periodically, daemon=True).start()
+        logging.info(f"Serving the PPP API from {DB_PATH} on {HOST}:{PORT}")
+        # One process with threads, long polls are woken up through episodes_available which only works within a process
+        serve(app, host=HOST, port=PORT, threads=THREADS)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# Offline benchmark for transcribe-me.py.
+#
+# Starts a stand-in for the PPP API (GET /episode, GET /audio/..., POST /results) on localhost,
+# generates a synthetic episode with ffmpeg and runs the worker once per configuration until all
+# episodes are uploaded. The worker is pointed at the stand-in API and, unless --whisper is given,
+# at fake-whisper.py, a deterministic whisper.cpp stand-in that transcribes at a fixed multiple of
+# real time. Nothing leaves the machine, so runs are reproducible and comparable between commits.
+#
+# For every configuration it reports episodes per hour, p50/p90/max of every stage time the worker
+# wrote to output/stats.jsonl, the peak RSS of the worker and all its child processes (ffmpeg,
+# whisper.cpp) and the high-water mark of the worker's output folder.
+#
+#   python3 benchmark.py                                  # all configurations, fake whisper
+#   python3 benchmark.py --configs baseline server --episodes 10 --minutes 30
+#   python3 benchmark.py --whisper /app/whisper.cpp/main --whisper-server /app/whisper.cpp/server --model-dir /app/models
+#   python3 benchmark.py --report results.json            # also write the numbers as JSON
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import gzip
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_SCRIPT = os.path.join(BENCH_DIR, "..", "ppp-docker", "transcribe-me.py")
+FAKE_WHISPER = os.path.join(BENCH_DIR, "fake-whisper.py")
+MODEL_NAME = "ggml-large-v3-turbo.bin"
+SAMPLE_INTERVAL = 0.2
+
+# Worker settings compared by default, every entry is a set of extra environment variables
+CONFIGS = {
+    "baseline": {},
+    "pipeline": {"PIPELINE": "1", "PREFETCH_DEPTH": "2"},
+    "streaming": {"STREAMING": "1"},
+    "server": {"ENGINE": "whisper.cpp-server"},
+    "chunked": {"CHUNKED": "1"},
+    "pipeline+streaming+server": {"PIPELINE": "1", "STREAMING": "1", "ENGINE": "whisper.cpp-server"},
+    "workers2": {"WORKERS": "2"},
+}
+
+class StandInAPI:
+    """Hands out the same synthetic episode N times under different GUIDs and records the uploads."""
+
+    def __init__(self, audio_path, episodes):
+        self.audio_path = audio_path
+        self.episodes = episodes
+        self.lock = threading.Lock()
+        self.leased = 0
+        self.results = []
+        self.done = threading.Event()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset(self):
+        with self.lock:
+            self.leased = 0
+            self.results = []
+            self.done.clear()
+
+    def lease(self):
+        with self.lock:
+            if self.leased >= self.episodes:
+                return None
+            self.leased += 1
+            number = self.leased
+        return {
+            "guid": f"bench-{number}",
+            "podcast_name": "Benchmark",
+            "episode_title": f"Benchmark Episode {number}",
+            # A distinct URL per episode, so the worker's audio cache can't turn the run into cache hits
+            "file_url": f"http://127.0.0.1:{self.port}/audio/episode-{number}.mp3",
+            "token": f"token-{number}",
+            "token_created_at": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime()),
+        }
+
+    def record_result(self, body, encoding, received_bytes):
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "zstd":
+            body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+        data = json.loads(body)
+        with self.lock:
+            self.results.append({"guid": data["guid"], "time": time.monotonic(), "bytes": received_bytes})
+            if len(self.results) >= self.episodes:
+                self.done.set()
+
+    def handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status, body=b"", content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                if self.path.split("?")[0] == "/episode":
+                    episode = api.lease()
+                    if episode is None:
+                        self.reply(404, b'{"message": "No episodes available"}')
+                    else:
+                        self.reply(200, json.dumps(episode).encode())
+                elif self.path.startswith("/audio/"):
+                    with open(api.audio_path, "rb") as f:
+                        data = f.read()
+                    range_header = self.headers.get("Range")
+                    if range_header and range_header.startswith("bytes="):
+                        start, _, end = range_header[6:].partition("-")
+                        start = int(start)
+                        end = int(end) if end else len(data) - 1
+                        self.reply(206, data[start:end + 1], "audio/mpeg",
+                                   {"Content-Range": f"bytes {start}-{end}/{len(data)}", "Accept-Ranges": "bytes"})
+                    else:
+                        self.reply(200, data, "audio/mpeg", {"Accept-Ranges": "bytes"})
+                else:
+                    self.reply(404, b'{"error": "not found"}')
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path != "/results":
+                    self.reply(404, b'{"error": "not found"}')
+                    return
+                try:
+                    api.record_result(body, self.headers.get("Content-Encoding"), len(body))
+                except (ValueError, KeyError) as e:
+                    self.reply(400, json.dumps({"error": str(e)}).encode())
+                    return
+                self.reply(200, b'{"message": "Results received"}')
+
+        return Handler
+
+def make_episode_audio(path, minutes):
+    # Bursts of tone and noise separated by pauses, so the chunked mode finds silences to cut at.
+    # Fixed seed and bitexact flags keep the file identical between runs.
+    duration = int(minutes * 60)
+    expression = "if(lt(mod(t\\,12)\\,9)\\,0.3*sin(2*PI*(220+40*mod(floor(t)\\,5))*t)+0.05*random(0)\\,0)"
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-f", "lavfi", "-i",
+                    f"aevalsrc=exprs={expression}:s=16000:d={duration}:c=mono",
+                    "-fflags", "+bitexact", "-map_metadata", "-1", "-ac", "1", "-b:a", "64k", path], check=True)
+
+def process_tree(root_pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name can contain spaces, the parent pid is the second field after it
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    pids = [root_pid]
+    for pid in pids:
+        pids.extend(children.get(pid, []))
+    return pids
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def directory_bytes(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+def sample_resources(process, output_dir, peaks, stop):
+    while not stop.is_set() and process.poll() is None:
+        peaks["rss_bytes"] = max(peaks["rss_bytes"], sum(rss_bytes(pid) for pid in process_tree(process.pid)))
+        peaks["disk_bytes"] = max(peaks["disk_bytes"], directory_bytes(output_dir))
+        time.sleep(SAMPLE_INTERVAL)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+def stage_latencies(stats_file):
+    stages = {}
+    if not os.path.exists(stats_file):
+        return stages
+    with open(stats_file) as f:
+        for line in f:
+            record = json.loads(line)
+            for key, value in record.items():
+                if key.endswith("_seconds") and key != "audio_seconds" and isinstance(value, (int, float)):
+                    stages.setdefault(key[:-len("_seconds")], []).append(value)
+    return {stage: {"p50": percentile(values, 0.5), "p90": percentile(values, 0.9), "max": max(values)}
+            for stage, values in sorted(stages.items())}
+
+def run_config(name, extra_env, api, args, run_root):
+    run_dir = os.path.join(run_root, name.replace("+", "-"))
+    output_dir = os.path.join(run_dir, "output")
+    os.makedirs(output_dir)
+    env = dict(os.environ)
+    env.update({
+        "API_BASE_URL": f"http://127.0.0.1:{api.port}",
+        "WHISPER_CPP_PATH": args.whisper,
+        "WHISPER_SERVER_PATH": args.whisper_server,
+        "MODEL_DIR": args.model_dir,
+        "VERIFY_MODEL": "0",  # Nothing leaves the machine, the model is used as it is
+        "NICKNAME": "benchmark",
+        "FAKE_WHISPER_SPEED": str(args.speed),
+        "FAKE_WHISPER_LOAD_SECONDS": str(args.load_seconds),
+        "PYTHONUNBUFFERED": "1",
+    })
+    env.update(extra_env)
+    api.reset()
+    print(f"Running {name} ({' '.join(f'{k}={v}' for k, v in extra_env.items()) or 'defaults'})...", flush=True)
+
+    with open(os.path.join(run_dir, "worker.out"), "wb") as worker_out:
+        started_at = time.monotonic()
+        # Own process group, so stopping the run also stops ffmpeg, whisper.cpp and forked workers
+        process = subprocess.Popen([sys.executable, os.path.abspath(WORKER_SCRIPT)], cwd=run_dir, env=env,
+                                   stdout=worker_out, stderr=subprocess.STDOUT, start_new_session=True)
+        peaks = {"rss_bytes": 0, "disk_bytes": 0}
+        stop = threading.Event()
+        sampler = threading.Thread(target=sample_resources, args=(process, output_dir, peaks, stop), daemon=True)
+        sampler.start()
+        while not api.done.wait(1):
+            if process.poll() is not None or time.monotonic() - started_at > args.timeout:
+                break
+        stop.set()
+        sampler.join()
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+
+    results = list(api.results)
+    elapsed = (results[-1]["time"] if results else time.monotonic()) - started_at
+    report = {
+        "config": name,
+        "env": extra_env,
+        "completed": len(results),
+        "episodes": api.episodes,
+        "wall_seconds": round(elapsed, 2),
+        "episodes_per_hour": round(len(results) / elapsed * 3600, 1) if results else 0.0,
+        "peak_rss_mb": round(peaks["rss_bytes"] / 1e6, 1),
+        "peak_disk_mb": round(peaks["disk_bytes"] / 1e6, 1),
+        "upload_mb": round(sum(result["bytes"] for result in results) / 1e6, 3),
+        "stages": stage_latencies(os.path.join(output_dir, "stats.jsonl")),
+    }
+    if len(results) < api.episodes:
+        print(f"  {name} only uploaded {len(results)}/{api.episodes} episodes, see {run_dir}/worker.out", flush=True)
+    return report
+
+def print_report(reports):
+    print()
+    print(f"{'config':<28}{'done':>7}{'eps/hour':>10}{'wall s':>9}{'RSS MB':>9}{'disk MB':>9}{'upload MB':>11}")
+    for report in reports:
+        print(f"{report['config']:<28}{report['completed']:>3}/{report['episodes']:<3}{report['episodes_per_hour']:>10}"
+              f"{report['wall_seconds']:>9}{report['peak_rss_mb']:>9}{report['peak_disk_mb']:>9}{report['upload_mb']:>11}")
+    print()
+    print(f"{'config':<28}{'stage':<16}{'p50 s':>9}{'p90 s':>9}{'max s':>9}")
+    for report in reports:
+        for stage, latency in report["stages"].items():
+            print(f"{report['config']:<28}{stage:<16}{latency['p50']:>9}{latency['p90']:>9}{latency['max']:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the PPP transcription worker.")
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS), help="configurations to run")
+    parser.add_argument("--episodes", type=int, default=6, help="episodes per configuration (default 6)")
+    parser.add_argument("--minutes", type=float, default=10, help="length of the synthetic episode (default 10)")
+    parser.add_argument("--speed", type=float, default=60, help="fake whisper speed as a multiple of real time (default 60)")
+    parser.add_argument("--load-seconds", type=float, default=2, help="fake whisper model load time (default 2)")
+    parser.add_argument("--whisper", default=FAKE_WHISPER, help="whisper.cpp main binary (default: fake-whisper.py)")
+    parser.add_argument("--whisper-server", default=None, help="whisper.cpp server binary (default: same as --whisper)")
+    parser.add_argument("--model-dir", default=None, help=f"directory containing {MODEL_NAME} (default: a dummy file)")
+    parser.add_argument("--timeout", type=float, default=1800, help="give up on a configuration after this many seconds")
+    parser.add_argument("--keep", action="store_true", help="keep the run folders (worker logs, stats.jsonl)")
+    parser.add_argument("--report", help="also write the results to this JSON file")
+    args = parser.parse_args()
+    args.whisper = os.path.abspath(args.whisper)
+    args.whisper_server = os.path.abspath(args.whisper_server or args.whisper)
+
+    if shutil.which("ffmpeg") is None:
+        sys.exit("ffmpeg is needed to generate the benchmark audio and to run the worker")
+
+    run_root = tempfile.mkdtemp(prefix="ppp-bench-")
+    try:
+        if args.model_dir is None:
+            # The fake transcriber never reads the model. An empty file is enough, as VERIFY_MODEL=0 (see run_config)
+            # keeps the worker from checking it against Hugging Face and downloading the real one
+            args.model_dir = os.path.join(run_root, "models")
+            os.makedirs(args.model_dir)
+            open(os.path.join(args.model_dir, MODEL_NAME), "wb").close()
+        args.model_dir = os.path.abspath(args.model_dir)
+
+        audio_path = os.path.join(run_root, "episode.mp3")
+        print(f"Generating a {args.minutes:g} minute episode...", flush=True)
+        make_episode_audio(audio_path, args.minutes)
+        api = StandInAPI(audio_path, args.episodes)
+
+        reports = [run_config(name, CONFIGS[name], api, args, run_root) for name in args.configs]
+        api.server.shutdown()
+        print_report(reports)
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump({"episodes": args.episodes, "minutes": args.minutes, "speed": args.speed,
+                           "load_seconds": args.load_seconds, "whisper": args.whisper, "runs": reports}, f, indent=2)
+            print(f"\nWrote {args.report}")
+    finally:
+        if args.keep:
+            print(f"Run folders kept in {run_root}")
+        else:
+            shutil.rmtree(run_root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
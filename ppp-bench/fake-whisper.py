@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# Deterministic stand-in for the whisper.cpp "main" and "server" binaries, used by benchmark.py.
+# It never looks at the model file: it reads the WAV it is given, pretends to load a model for
+# FAKE_WHISPER_LOAD_SECONDS and then "transcribes" at FAKE_WHISPER_SPEED times real time, writing
+# one fixed segment every 5 seconds of audio in the same txt/srt/json layout whisper.cpp uses.
+#
+# Run it as "server" (any argument list containing --port) to mimic whisper.cpp's server example:
+# the model is loaded once and every POST /inference only pays the transcription time.
+import io
+import json
+import os
+import sys
+import threading
+import time
+import wave
+from email.parser import BytesParser
+from email.policy import default
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+LOAD_SECONDS = float(os.getenv("FAKE_WHISPER_LOAD_SECONDS", "2"))
+SPEED = float(os.getenv("FAKE_WHISPER_SPEED", "60"))
+SEGMENT_MS = 5000
+# The real server holds a model mutex and transcribes one request at a time, health checks are still answered meanwhile
+inference_lock = threading.Lock()
+
+def wav_duration_ms(data):
+    try:
+        with wave.open(io.BytesIO(data)) as w:
+            return int(w.getnframes() * 1000 / w.getframerate())
+    except (wave.Error, EOFError):
+        # Headers written by a streaming ffmpeg can carry placeholder sizes; assume 16 kHz mono s16
+        return int(max(0, len(data) - 44) * 1000 / 32000)
+
+def fake_segments(duration_ms):
+    segments = []
+    start = 0
+    while start < duration_ms:
+        end = min(start + SEGMENT_MS, duration_ms)
+        segments.append((start, end, f" Segment {len(segments) + 1} of the benchmark episode."))
+        start = end
+    return segments
+
+def transcribe(data):
+    duration_ms = wav_duration_ms(data)
+    time.sleep(duration_ms / 1000 / SPEED)
+    return duration_ms, fake_segments(duration_ms)
+
+def format_timestamp(ms, separator=","):
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}{separator}{ms % 1000:03d}"
+
+def run_cli(args):
+    audio = args[args.index("-f") + 1]
+    output_base = args[args.index("-of") + 1]
+    started_at = time.monotonic()
+    time.sleep(LOAD_SECONDS)
+    load_ms = (time.monotonic() - started_at) * 1000
+    if audio == "-":
+        data = sys.stdin.buffer.read()
+    else:
+        with open(audio, "rb") as f:
+            data = f.read()
+    duration_ms, segments = transcribe(data)
+    if "-otxt" in args:
+        with open(f"{output_base}.txt", "w") as f:
+            f.writelines(f"{text}\n" for _, _, text in segments)
+    if "-osrt" in args:
+        with open(f"{output_base}.srt", "w") as f:
+            for i, (start, end, text) in enumerate(segments, 1):
+                f.write(f"{i}\n{format_timestamp(start)} --> {format_timestamp(end)}\n{text}\n\n")
+    if "-oj" in args:
+        with open(f"{output_base}.json", "w") as f:
+            json.dump({
+                "result": {"language": "en"},
+                "transcription": [{"timestamps": {"from": format_timestamp(start), "to": format_timestamp(end)},
+                                   "offsets": {"from": start, "to": end},
+                                   "text": text} for start, end, text in segments],
+            }, f, indent=2)
+    print(f"fake-whisper: transcribed {duration_ms / 1000:.1f} seconds of audio", flush=True)
+    print(f"whisper_print_timings:     load time = {load_ms:8.2f} ms", file=sys.stderr, flush=True)
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.reply(200, b'{"status": "ok"}')
+
+    def do_POST(self):
+        if self.path != "/inference":
+            self.reply(404, b'{"error": "not found"}')
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        message = BytesParser(policy=default).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+        parts = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                 for part in message.iter_parts()}
+        with inference_lock:
+            _, segments = transcribe(parts.get("file", b""))
+        self.reply(200, json.dumps({
+            "language": "english",
+            "segments": [{"id": i, "start": start / 1000, "end": end / 1000, "text": text}
+                         for i, (start, end, text) in enumerate(segments)],
+        }).encode())
+
+def run_server(args):
+    host = args[args.index("--host") + 1] if "--host" in args else "127.0.0.1"
+    port = int(args[args.index("--port") + 1])
+    print(f"fake-whisper: loading model for {LOAD_SECONDS} seconds", flush=True)
+    time.sleep(LOAD_SECONDS)
+    print(f"fake-whisper: listening on {host}:{port}", flush=True)
+    ThreadingHTTPServer((host, port), InferenceHandler).serve_forever()
+
+if __name__ == "__main__":
+    if "--port" in sys.argv[1:]:
+        run_server(sys.argv[1:])
+    else:
+        run_cli(sys.argv[1:])
@@ -2,52 +2,506 @@ import os
 import subprocess
 import requests
 import logging
+import logging.handlers
 import time
 import re
+import hashlib
+import shutil
+import random
+import queue
+import collections
+import threading
+import struct
+import json
+import atexit
+import bisect
+import io
+import wave
+import gzip
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import signal
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # Only needed for UPLOAD_COMPRESSION=zstd
+try:
+    import faster_whisper
+except ImportError:
+    faster_whisper = None  # Only needed for ENGINE=faster-whisper
 
 # Configuration
-API_URL = "http://ppp.wirr.de:5000/episode"
-UPLOAD_URL = "http://ppp.wirr.de:5000/results"
+API_BASE_URL = os.getenv("API_BASE_URL", "http://ppp.wirr.de:5000")
+API_URL = f"{API_BASE_URL}/episode"
+UPLOAD_URL = f"{API_BASE_URL}/results"
 LOG_FILE = "output/podcast_transcriber.log"
-MODEL_DIR = "/app/models"
+STATS_FILE = "output/stats.jsonl"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Serve Prometheus metrics on this port, 0 disables it
+MODEL_DIR = os.getenv("MODEL_DIR", "/app/models")
 MODEL_NAME = "ggml-large-v3-turbo.bin"
 MODEL_PATH = os.path.join(MODEL_DIR, MODEL_NAME)
-MODEL_URL = f"https://huggingface.co/ggerganov/whisper.cpp/resolve/main/{MODEL_NAME}"
-WHISPER_CPP_PATH = "/app/whisper.cpp/main"
+MODEL_BASE_URL = "https://huggingface.co/ggerganov/whisper.cpp/resolve/main"
+WHISPER_CPP_PATH = os.getenv("WHISPER_CPP_PATH", "/app/whisper.cpp/main")
+WHISPER_SERVER_PATH = os.getenv("WHISPER_SERVER_PATH", "/app/whisper.cpp/server")
+MODEL_DOWNLOAD_SEGMENTS = max(1, int(os.getenv("MODEL_DOWNLOAD_SEGMENTS", "4")))
+VERIFY_MODEL = os.getenv("VERIFY_MODEL", "1") == "1"  # 0 uses an existing model as it is, without asking Hugging Face
+LEASE_SECONDS = 12 * 60 * 60  # Episodes are reassigned if no results arrive within 12 hours
+
+# HTTP client: connect/read timeouts and jittered exponential backoff between retries
+HTTP_TIMEOUT = (float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")), float(os.getenv("HTTP_READ_TIMEOUT", "120")))
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 300
+# Waiting for new episodes starts short and backs off while the queue stays empty
+EMPTY_QUEUE_MIN_WAIT = 15
+EMPTY_QUEUE_MAX_WAIT = 600
+LONG_POLL_SECONDS = int(os.getenv("LONG_POLL_SECONDS", "0"))  # Ask the API to hold the request until an episode is available
+
+# Result uploads: "none", "gzip" or "zstd" Content-Encoding, optionally sending only the JSON
+UPLOAD_COMPRESSION = os.getenv("UPLOAD_COMPRESSION", "none")
+UPLOAD_JSON_ONLY = os.getenv("UPLOAD_JSON_ONLY", "0") == "1"
+
+# Journal of leased episodes and their last finished stage, so a restarted worker resumes instead of starting over,
+# and a spool for finished uploads the API didn't accept, sent again in the background until they get through
+JOURNAL_DIR = "output/journal"
+SPOOL_DIR = "output/upload_spool"
+SPOOL_CHECK_SECONDS = 60
+
+# Downloaded episodes are kept in a size-limited cache, so retried or reassigned episodes aren't fetched again
+AUDIO_CACHE_DIR = "output/audio_cache"
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "0"))  # 0 disables the cache
+
+# Finished transcripts are kept in a size-limited cache keyed by a hash of the decoded audio, so an episode
+# that was published again (or under another feed) is uploaded right away instead of being transcribed twice
+TRANSCRIPT_CACHE_DIR = "output/transcript_cache"
+TRANSCRIPT_CACHE_MAX_MB = int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "0"))  # 0 disables the cache
+
+# Pipeline mode: fetch, transcribe and upload run in their own threads
+PIPELINE = os.getenv("PIPELINE", "0") == "1"
+PREFETCH_DEPTH = max(1, int(os.getenv("PREFETCH_DEPTH", "1")))
+LEASE_MARGIN_SECONDS = int(os.getenv("LEASE_MARGIN_SECONDS", "3600"))
+
+# Shutdown: on SIGTERM/SIGINT stop leasing, give the current step this long to finish and hand unfinished leases back
+SHUTDOWN_GRACE_SECONDS = int(os.getenv("SHUTDOWN_GRACE_SECONDS", "8"))  # docker stop kills after 10 seconds unless given -t
+RELEASE_URL = f"{API_BASE_URL}/release"
+
+# Streaming mode: decode the HTTP response with ffmpeg in memory instead of writing .mp3 and .wav files
+STREAMING = os.getenv("STREAMING", "0") == "1"
+
+# Engine: "whisper.cpp" starts whisper.cpp per episode, "whisper.cpp-server" keeps the model loaded in a server,
+# "faster-whisper" runs CTranslate2 in this process with batched inference (int8 on CPU)
+ENGINE = os.getenv("ENGINE", "whisper.cpp")
+WHISPER_SERVER_PORT = int(os.getenv("WHISPER_SERVER_PORT", "8910"))
+WHISPER_SERVER_URL = f"http://127.0.0.1:{WHISPER_SERVER_PORT}"
+# A request to the server that takes longer than this many times the audio length (plus 5 minutes) counts as hung
+WHISPER_SERVER_TIMEOUT_FACTOR = float(os.getenv("WHISPER_SERVER_TIMEOUT_FACTOR", "3"))
+FASTER_WHISPER_MODEL = os.getenv("FASTER_WHISPER_MODEL", "large-v3-turbo")  # Model name or path, downloaded into MODEL_DIR
+FASTER_WHISPER_COMPUTE_TYPE = os.getenv("FASTER_WHISPER_COMPUTE_TYPE", "")  # Default: int8 on CPU, float16 on CUDA
+FASTER_WHISPER_BATCH_SIZE = int(os.getenv("FASTER_WHISPER_BATCH_SIZE", "8"))
+
+# whisper.cpp -t, -p and -bs, 0 keeps the whisper.cpp defaults
+CPU_COUNT = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", "0"))
+WHISPER_PROCESSORS = int(os.getenv("WHISPER_PROCESSORS", "0"))
+WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "0"))
+
+# Calibration: benchmark whisper.cpp settings and quantised models on a short clip once per host,
+# then run every episode with the fastest setting whose transcript stays close to the default one
+CALIBRATE = os.getenv("CALIBRATE", "0") == "1"
+RECALIBRATE = os.getenv("RECALIBRATE", "0") == "1"  # Ignore the cached profile and measure again
+CALIBRATION_FILE = "output/calibration.json"
+CALIBRATION_CLIP = os.getenv("CALIBRATION_CLIP", os.path.join(os.path.dirname(WHISPER_CPP_PATH), "samples", "jfk.wav"))
+CALIBRATION_LOOPS = 3  # The clip is repeated so model load and warm-up don't dominate the timing
+CALIBRATION_MODELS = [variant for variant in os.getenv("CALIBRATION_MODELS", "q5_0,q8_0").split(",") if variant]
+CALIBRATION_MAX_WER = float(os.getenv("CALIBRATION_MAX_WER", "0.05"))
+CALIBRATION_TIMEOUT = 900
+
+# Multi-worker mode: run several lease->transcribe->upload workers that share the host's cores and GPUs
+WORKERS = max(1, int(os.getenv("WORKERS", "1")))
+WORKER_QUICK_EXIT_SECONDS = 600  # A worker that fails sooner than this after starting most likely can't get its engine running
+WORKER_MAX_QUICK_EXITS = 5  # Such a worker is given up on after this many failures in a row
+
+# Chunked mode: cut the audio at silences and transcribe the chunks in parallel
+CHUNKED = os.getenv("CHUNKED", "0") == "1"
+CHUNK_SECONDS = int(os.getenv("CHUNK_SECONDS", "300"))
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "0"))  # 0 means a quarter of the available cores, as far as memory allows
+CHUNK_MEMORY_OVERHEAD = 512 * 1024 * 1024  # Working buffers of one whisper.cpp process on top of the model
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "-45"))
+SKIP_SILENCE_SECONDS = float(os.getenv("SKIP_SILENCE_SECONDS", "2"))
+
+# Setup logging. Records go through a queue and are written by a background thread,
+# so relaying whisper.cpp's output never waits on the log file or the console.
+log_listener = None
+log_listener_pid = None
+
+def setup_logging(log_file, worker_name=None):
+    global log_listener, log_listener_pid
+    if log_listener is not None:
+        stop_logging()
+    log_prefix = f"[{worker_name}] " if worker_name else ""
+    log_formatter = logging.Formatter(f'%(asctime)s %(levelname)s: {log_prefix}%(message)s')
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(log_formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(log_formatter)
+    log_queue = queue.Queue()
+    log_listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    log_listener.start()
+    log_listener_pid = os.getpid()
+    # The listener's handlers do the formatting, the queue only passes the plain message on
+    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[logging.handlers.QueueHandler(log_queue)], force=True)
+
+def stop_logging():
+    global log_listener
+    # After a fork the listener thread only exists in the parent, so there is nothing to flush
+    if log_listener_pid == os.getpid():
+        log_listener.stop()
+    for handler in log_listener.handlers:
+        handler.close()
+    log_listener = None
 
-# Setup logging
-log_formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s')
-file_handler = logging.FileHandler(LOG_FILE)
-file_handler.setFormatter(log_formatter)
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(log_formatter)
-logging.basicConfig(level=logging.INFO, handlers=[file_handler, console_handler])
+setup_logging(LOG_FILE)
+atexit.register(lambda: log_listener and stop_logging())
 
 # Retrieve or set default nickname
 nickname = os.getenv("NICKNAME", "anonymous")
 logging.info(f"Nickname: {nickname}")
 
-logging.info("Initializing setup for whisper.cpp...")
+def process_age():
+    # Seconds since this process was started, so the startup times include the Python imports
+    try:
+        with open("/proc/self/stat") as stat_file:
+            start_ticks = int(stat_file.read().rpartition(")")[2].split()[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+# Startup: the first episode is leased and downloaded while the model is verified and warmed up in the background
+startup_started_at = time.monotonic() - process_age()
+startup_times = {'imports': time.monotonic() - startup_started_at}
+engine_ready = threading.Event()
+engine_failed = False
+
+def mark_startup(step):
+    # Seconds from the start of the process until each step first finished
+    startup_times.setdefault(step, time.monotonic() - startup_started_at)
+
+def check_engine():
+    logging.info(f"Initializing setup for {ENGINE}...")
+    if ENGINE == "faster-whisper":
+        if faster_whisper is None:
+            logging.error("ENGINE=faster-whisper needs the faster-whisper package (pip install faster-whisper)")
+            exit(1)
+        return
+    # Ensure whisper.cpp has correct permissions
+    whisper_binary = WHISPER_SERVER_PATH if ENGINE == "whisper.cpp-server" else WHISPER_CPP_PATH
+    if not os.path.exists(whisper_binary):
+        logging.error(f"Whisper.cpp executable not found at {whisper_binary}")
+        exit(1)
+    if not os.access(whisper_binary, os.X_OK):
+        os.chmod(whisper_binary, 0o755)
+        logging.info(f"Made {whisper_binary} executable.")
+
+# One pooled keep-alive session per thread, reset in forked workers so they don't share sockets
+http_local = threading.local()
+os.register_at_fork(after_in_child=lambda: http_local.__dict__.clear())
+
+def http_session():
+    session = getattr(http_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        http_local.session = session
+    return session
+
+# Metrics: counters and summaries (count/sum) keyed by name and labels, served in Prometheus
+# text format, plus a per-episode stats record that is appended to STATS_FILE
+metrics_lock = threading.Lock()
+metric_counters = collections.defaultdict(float)
+metric_summaries = collections.defaultdict(lambda: [0, 0.0])
+stats_local = threading.local()
+
+def metric_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def metric_inc(name, value=1, **labels):
+    with metrics_lock:
+        metric_counters[metric_key(name, labels)] += value
 
-# Ensure whisper.cpp has correct permissions
-if not os.path.exists(WHISPER_CPP_PATH):
-    logging.error(f"Whisper.cpp executable not found at {WHISPER_CPP_PATH}")
-    exit(1)
-os.chmod(WHISPER_CPP_PATH, 0o755)
-logging.info(f"Ensured whisper.cpp executable has correct permissions.")
+def metric_observe(name, value, **labels):
+    with metrics_lock:
+        summary = metric_summaries[metric_key(name, labels)]
+        summary[0] += 1
+        summary[1] += value
 
-# Function to download the model if it doesn't exist
-def download_model():
-    if not os.path.exists(MODEL_PATH):
-        logging.info(f"Model file not found at {MODEL_PATH}. Downloading...")
+def add_episode_stat(key, value):
+    # Adds to the stats of the episode the current thread is working on, if any
+    stats = getattr(stats_local, 'episode', None)
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + value
+
+@contextlib.contextmanager
+def stage_timer(stage):
+    started_at = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started_at
+        add_episode_stat(f"{stage}_seconds", elapsed)
+        metric_observe("ppp_stage_seconds", elapsed, stage=stage)
+
+def engine_model():
+    return FASTER_WHISPER_MODEL if ENGINE == "faster-whisper" else MODEL_NAME
+
+def write_episode_stats(episode, status):
+    stats = episode.get('stats', {})
+    record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'guid': episode.get('guid'), 'podcast_name': episode.get('podcast_name'),
+              'status': status, 'engine': ENGINE, 'model': engine_model()}
+    record.update({key: round(value, 3) if isinstance(value, float) else value for key, value in stats.items()})
+    if stats.get('download_seconds') and stats.get('download_bytes'):
+        record['download_bytes_per_second'] = round(stats['download_bytes'] / stats['download_seconds'])
+    if stats.get('transcribe_seconds') and stats.get('audio_seconds'):
+        record['real_time_factor'] = round(stats['transcribe_seconds'] / stats['audio_seconds'], 4)
+        metric_observe("ppp_real_time_factor", record['real_time_factor'])
+        recent_rtf.append(record['real_time_factor'])
+    metric_inc("ppp_episodes_total", status=status)
+    try:
+        with open(STATS_FILE, 'a') as stats_file:
+            stats_file.write(json.dumps(record) + "\n")
+    except OSError as e:
+        logging.warning(f"Could not write episode stats: {e}")
+
+# Real-time factors of the latest episodes, used to tell whether a new episode fits into its lease
+recent_rtf = collections.deque(maxlen=20)
+
+def load_recent_rtf():
+    # Seed the estimate from earlier runs with the same engine and model
+    try:
+        with open(STATS_FILE) as stats_file:
+            for line in stats_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('real_time_factor') and record.get('engine') == ENGINE and record.get('model') == engine_model():
+                    recent_rtf.append(record['real_time_factor'])
+    except OSError:
+        pass
+
+def format_metrics():
+    def format_labels(labels):
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}" if labels else ""
+    lines = []
+    with metrics_lock:
+        for (name, labels), value in sorted(metric_counters.items()):
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), (count, total) in sorted(metric_summaries.items()):
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = format_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would flood the log otherwise
+
+def start_metrics_server(port):
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info(f"Serving metrics on port {port} at /metrics")
+
+# Set by SIGTERM/SIGINT. Waits use it instead of time.sleep, so a shutdown doesn't sit out a backoff.
+shutdown_event = threading.Event()
+
+def backoff_delay(retry_count, base=RETRY_BASE_SECONDS, cap=RETRY_MAX_SECONDS):
+    # Exponential backoff with jitter, so a fleet of workers doesn't retry in lockstep
+    delay = min(cap, base * 2 ** retry_count)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def wait_before_retry(retry_count, stage):
+    metric_inc("ppp_retries_total", stage=stage)
+    add_episode_stat(f"{stage}_retries", 1)
+    delay = backoff_delay(retry_count)
+    logging.info(f"Waiting {delay:.0f} seconds before retry {retry_count + 2}...")
+    shutdown_event.wait(delay)
+
+# Downloads read small chunks while the connection is slow and bigger ones once it is fast
+DOWNLOAD_CHUNK_MIN = 64 * 1024
+DOWNLOAD_CHUNK_MAX = 4 * 1024 * 1024
+
+def stream_to_file(response, file):
+    chunk_size = DOWNLOAD_CHUNK_MIN
+    written = 0
+    while True:
+        started_at = time.monotonic()
+        chunk = response.raw.read(chunk_size, decode_content=True)
+        if not chunk:
+            return written
+        file.write(chunk)
+        written += len(chunk)
+        elapsed = time.monotonic() - started_at
+        if elapsed < 0.1 and chunk_size < DOWNLOAD_CHUNK_MAX:
+            chunk_size *= 2
+        elif elapsed > 1 and chunk_size > DOWNLOAD_CHUNK_MIN:
+            chunk_size //= 2
+
+def download_range(url, part_path, start=0, end=None, require_audio=False):
+    # Download bytes start..end (inclusive, None meaning up to the end) of url into part_path,
+    # continuing after whatever an earlier attempt already wrote there.
+    # Returns the total size of the remote file if the server told us.
+    done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if end is not None and start + done > end:
+        return None
+    headers = {}
+    if start + done > 0 or end is not None:
+        headers['Range'] = f"bytes={start + done}-{'' if end is None else end}"
+    with http_session().get(url, stream=True, headers=headers, timeout=HTTP_TIMEOUT) as r:
+        if r.status_code == 416 and done:
+            return None  # Nothing left to fetch
+        if r.status_code not in (200, 206):
+            r.raise_for_status()
+            raise requests.exceptions.HTTPError(f"Unexpected status code {r.status_code}", response=r)
+        if require_audio and 'audio' not in r.headers.get('Content-Type', ''):
+            raise ValueError(f"Unexpected Content-Type: {r.headers.get('Content-Type')}")
+        total_size = None
+        if r.status_code == 206:
+            content_range = r.headers.get('Content-Range', '')
+            if content_range.rpartition('/')[2].isdigit():
+                total_size = int(content_range.rpartition('/')[2])
+            mode = 'ab'
+        else:
+            if start > 0:
+                raise ValueError("Server ignored the Range header")
+            if done:
+                logging.info("Server doesn't support resuming, starting the download over.")
+            if r.headers.get('Content-Length', '').isdigit():
+                total_size = int(r.headers['Content-Length'])
+            mode = 'wb'
+        with open(part_path, mode) as part_file:
+            written = stream_to_file(r, part_file)
+        add_episode_stat("download_bytes", written)
+        metric_inc("ppp_download_bytes_total", written)
+        return total_size
+
+def probe_model(model_url):
+    # Hugging Face reports the size and sha256 of LFS files on the redirect of the resolve URL
+    response = http_session().head(model_url, allow_redirects=False, timeout=HTTP_TIMEOUT)
+    size = response.headers.get('X-Linked-Size')
+    sha256 = response.headers.get('X-Linked-Etag', '').strip('"')
+    if response.is_redirect:
+        response = http_session().head(model_url, allow_redirects=True, timeout=HTTP_TIMEOUT)
+    if not size and response.headers.get('Content-Length', '').isdigit():
+        size = response.headers['Content-Length']
+    accepts_ranges = response.headers.get('Accept-Ranges') == 'bytes'
+    return (int(size) if size else None), (sha256 if re.fullmatch(r'[0-9a-f]{64}', sha256) else None), accepts_ranges
+
+def download_model_segment(model_url, part_path, start, end):
+    max_retries = 10
+    for retry_count in range(max_retries):
+        try:
+            download_range(model_url, part_path, start, end)
+            return
+        except Exception as e:
+            logging.warning(f"Attempt {retry_count + 1}/{max_retries}: Error downloading model segment {start}-{end}: {e}")
+            if retry_count < max_retries - 1:
+                wait_before_retry(retry_count, "model_download")
+    raise RuntimeError(f"Failed to download model segment {start}-{end} after maximum retries")
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_MAX), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def write_model_marker(model_path, sha256):
+    stat = os.stat(model_path)
+    with open(f"{model_path}.verified", 'w') as marker_file:
+        json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}, marker_file)
+
+def verify_model(model_path, model_url):
+    # Check the model against the size and sha256 Hugging Face reports. The result is kept in a marker
+    # next to the model, so later starts only compare size and modification time instead of hashing 1.6 GB.
+    try:
+        with open(f"{model_path}.verified") as marker_file:
+            marker = json.load(marker_file)
+        stat = os.stat(model_path)
+        if marker.get('size') == stat.st_size and marker.get('mtime_ns') == stat.st_mtime_ns:
+            return True
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        size, sha256, _ = probe_model(model_url)
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Could not check {model_path} against Hugging Face ({e}), using it as it is.")
+        return True
+    if size and os.path.getsize(model_path) != size:
+        logging.warning(f"{model_path} has {os.path.getsize(model_path)} bytes instead of {size}.")
+        return False
+    logging.info(f"Verifying {model_path}...")
+    digest = hash_file(model_path)
+    if sha256 and digest != sha256:
+        logging.warning(f"{model_path} has the checksum {digest} instead of {sha256}.")
+        return False
+    write_model_marker(model_path, digest)
+    return True
+
+# Function to download the model if it isn't there or doesn't match what Hugging Face has
+def download_model(model_name=None):
+    model_name = model_name or MODEL_NAME
+    model_path = os.path.join(MODEL_DIR, model_name)
+    model_url = f"{MODEL_BASE_URL}/{model_name}"
+    if os.path.exists(model_path) and VERIFY_MODEL and not verify_model(model_path, model_url):
+        logging.info(f"Downloading {model_name} again...")
+        os.remove(model_path)
+    if not os.path.exists(model_path):
+        logging.info(f"Model file not found at {model_path}. Downloading...")
         os.makedirs(MODEL_DIR, exist_ok=True)
         try:
-            response = requests.get(MODEL_URL, stream=True)
-            response.raise_for_status()
-            with open(MODEL_PATH, 'wb') as model_file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        model_file.write(chunk)
+            size, sha256, accepts_ranges = probe_model(model_url)
+            # Fetch the model in parallel ranged segments, each resumable from its own part file
+            segments = MODEL_DOWNLOAD_SEGMENTS if size and accepts_ranges else 1
+            bounds = [(i * size // segments, (i + 1) * size // segments - 1) for i in range(segments)] if segments > 1 else [(0, None)]
+            part_paths = [f"{model_path}.part{i}" for i in range(segments)]
+            with ThreadPoolExecutor(max_workers=segments) as executor:
+                list(executor.map(download_model_segment, [model_url] * segments, part_paths, *zip(*bounds)))
+
+            # Join the segments into a temp file, hashing on the way, then verify and move it into place
+            hasher = hashlib.sha256()
+            with open(f"{model_path}.tmp", 'wb') as model_file:
+                for part_path in part_paths:
+                    with open(part_path, 'rb') as part_file:
+                        for chunk in iter(lambda: part_file.read(DOWNLOAD_CHUNK_MAX), b""):
+                            hasher.update(chunk)
+                            model_file.write(chunk)
+            downloaded_size = os.path.getsize(f"{model_path}.tmp")
+            for part_path in part_paths:
+                os.remove(part_path)
+            if size and downloaded_size != size:
+                os.remove(f"{model_path}.tmp")
+                raise ValueError(f"Model size mismatch: expected {size} bytes, got {downloaded_size}")
+            if sha256 and hasher.hexdigest() != sha256:
+                os.remove(f"{model_path}.tmp")
+                raise ValueError(f"Model checksum mismatch: expected {sha256}, got {hasher.hexdigest()}")
+            os.replace(f"{model_path}.tmp", model_path)
+            write_model_marker(model_path, hasher.hexdigest())
             logging.info("Model download completed successfully.")
         except requests.exceptions.HTTPError as http_err:
             logging.error(f"HTTP error occurred while downloading model: {http_err}")
@@ -56,24 +510,88 @@ def download_model():
             logging.error(f"Error downloading model: {e}")
             raise
     else:
-        logging.info(f"Model file already exists at {MODEL_PATH}. Skipping download.")
+        logging.info(f"Model file already exists at {model_path}. Skipping download.")
+
+def prefault_model(model_path):
+    # Read the model once, so whisper.cpp loads it from the page cache instead of the disk
+    with open(model_path, 'rb', buffering=0) as model_file:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(model_file.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        buffer = bytearray(DOWNLOAD_CHUNK_MAX)
+        while model_file.readinto(buffer):
+            pass
 
-# Call the download_model function before processing
-download_model()
+def warm_up_engine():
+    # Runs next to the first lease and download: verify (or download) the model, pull it into the page cache
+    # and load it into the resident engine. faster-whisper fetches its own model format when it loads.
+    global engine_failed
+    try:
+        if ENGINE != "faster-whisper":
+            download_model(MODEL_NAME)
+            mark_startup("model_verified")
+            prefault_model(MODEL_PATH)
+            mark_startup("model_prefaulted")
+        if ENGINES[ENGINE]['start']:
+            # Load the model once up front instead of once per episode
+            ENGINES[ENGINE]['start']()
+        mark_startup("engine_ready")
+        logging.info(f"{ENGINE} is ready.")
+    except Exception:
+        logging.exception(f"Could not get {ENGINE} ready")
+        engine_failed = True
+        shutdown_event.set()
+    finally:
+        engine_ready.set()
+
+def wait_for_engine():
+    if not engine_ready.is_set():
+        logging.info(f"Waiting for {ENGINE} to finish warming up...")
+        with stage_timer("engine_wait"):
+            while not engine_ready.wait(1):
+                if shutdown_event.is_set():
+                    raise RuntimeError("Shutting down")
+    if engine_failed:
+        raise RuntimeError(f"{ENGINE} could not be started")
+    if 'first_transcription' not in startup_times:
+        mark_startup("first_transcription")
+        steps = ", ".join(f"{step.replace('_', ' ')} {seconds:.1f}s" for step, seconds in sorted(startup_times.items(), key=lambda item: item[1]))
+        logging.info(f"Startup times since the process started: {steps}")
+
+empty_queue_wait = EMPTY_QUEUE_MIN_WAIT
+
+def wait_for_new_episodes():
+    global empty_queue_wait
+    delay = empty_queue_wait / 2 + random.uniform(0, empty_queue_wait / 2)
+    logging.info(f"No unprocessed episodes available. Retrying in {delay:.0f} seconds...")
+    shutdown_event.wait(delay)
+    empty_queue_wait = min(empty_queue_wait * 2, EMPTY_QUEUE_MAX_WAIT)
 
 def request_episode():
+    global empty_queue_wait
     max_retries = 10
     retry_count = 0
     
-    while retry_count < max_retries:
+    while retry_count < max_retries and not shutdown_event.is_set():
         logging.info("Requesting a new episode from the API...")
-        response = requests.get(API_URL)
-        if response.status_code == 404:
-            logging.info("No unprocessed episodes available. Retrying in 10 minutes...")
-            time.sleep(600)  # Wait for 10 minutes before retrying
-            return None, None, None, None
-        elif response.status_code == 200:
+        requested_at = time.monotonic()
+        try:
+            if LONG_POLL_SECONDS:
+                response = http_session().get(API_URL, params={'wait': LONG_POLL_SECONDS},
+                                              timeout=(HTTP_TIMEOUT[0], HTTP_TIMEOUT[1] + LONG_POLL_SECONDS))
+            else:
+                response = http_session().get(API_URL, timeout=HTTP_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Attempt {retry_count + 1}/{max_retries}: Error fetching episode: {e}")
+            response = None
+        if response is not None and response.status_code == 404:
+            # A long-polling API already waited for us, so ask again right away
+            if not LONG_POLL_SECONDS or time.monotonic() - requested_at < LONG_POLL_SECONDS / 2:
+                wait_for_new_episodes()
+            return None
+        elif response is not None and response.status_code == 200:
+            empty_queue_wait = EMPTY_QUEUE_MIN_WAIT
             episode = response.json()
+            episode['leased_at'] = time.time()
             
             # Log the entire received episode data as a block
             logging.info(f"Received episode data:\n"
@@ -86,117 +604,837 @@ def request_episode():
                          f"Token Created At: {episode['token_created_at']}\n"
                          f"-------------------------")
             
-            return episode['file_url'], episode['guid'], episode['token'], episode['podcast_name']
-        else:
+            return episode
+        elif response is not None:
             logging.warning(f"Attempt {retry_count + 1}/{max_retries}: Error fetching episode. Status code: {response.status_code}")
         
         if retry_count < max_retries - 1:
-            logging.info(f"Waiting 60 seconds before retry {retry_count + 2}...")
-            time.sleep(60)
+            wait_before_retry(retry_count, "lease")
         retry_count += 1
     
     logging.error("Failed to fetch episode after maximum retries.")
-    return None, None, None, None
+    return None
+
+def parse_token_created_at(value):
+    # The API may send either an RFC 1123 date (Flask default) or an ISO 8601 timestamp
+    if not value:
+        return None
+    try:
+        created_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            created_at = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.timestamp()
+
+def lease_remaining(episode):
+    # Seconds left before the backend hands this episode to someone else.
+    # Use whichever of the server timestamp and our local lease time is earlier.
+    lease_started_at = episode['leased_at']
+    created_at = parse_token_created_at(episode.get('token_created_at'))
+    if created_at is not None:
+        lease_started_at = min(lease_started_at, created_at)
+    return lease_started_at + LEASE_SECONDS - time.time()
 
 def sanitize_filename(filename):
     # Replace any character that is not a letter, digit, or underscore with an underscore
     return re.sub(r'[<>:"/\\|?*]', '_', filename)
 
-def download_episode(episode_url, output_path):
+def audio_cache_key(value):
+    return hashlib.sha1(value.encode()).hexdigest()
+
+def audio_cache_lookup(episode_url, guid=None):
+    # Cached audio is stored by URL, with a GUID index so reassigned episodes with a changed URL are found too
+    if not AUDIO_CACHE_MAX_MB:
+        return None
+    cache_path = os.path.join(AUDIO_CACHE_DIR, audio_cache_key(episode_url))
+    if not os.path.exists(cache_path) and guid:
+        cache_path = os.path.join(AUDIO_CACHE_DIR, audio_cache_key(f"guid:{guid}"))
+    try:
+        os.utime(cache_path)  # Mark as recently used
+    except FileNotFoundError:
+        return None
+    return cache_path
+
+def link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+def audio_cache_store(episode_url, guid, audio_path):
+    if not AUDIO_CACHE_MAX_MB:
+        return
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    for key in (episode_url, f"guid:{guid}"):
+        cache_path = os.path.join(AUDIO_CACHE_DIR, audio_cache_key(key))
+        if not os.path.exists(cache_path):
+            link_or_copy(audio_path, cache_path)
+    evict_lru(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_MB * 1024 * 1024)
+
+def evict_lru(directory, max_bytes):
+    # Delete the least recently used files until the directory fits into max_bytes.
+    # Hard links to the same file are only counted once.
+    # Other workers share the cache, so files may disappear while we look at them.
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, path, stat.st_ino, stat.st_size))
+    total = sum({inode: size for _, _, inode, size in entries}.values())
+    remaining_links = collections.Counter(inode for _, _, inode, _ in entries)
+    for _, path, inode, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        remaining_links[inode] -= 1
+        if not remaining_links[inode]:
+            total -= size
+            logging.info(f"Evicted {path} from cache")
+
+# Transcript cache lookups of this worker, for the hit rate
+transcript_cache_lookups = collections.Counter()
+
+def audio_fingerprint(wav):
+    # blake2b over the PCM samples only, so streamed and decoded copies of the same audio match. The last
+    # second and any partial one are left out: when the mp3 comes through a pipe ffmpeg can't trim the
+    # encoder padding, and the resampler ends on slightly different samples.
+    # Engine and model are part of the key, a transcript from another model is not reused.
+    hasher = hashlib.blake2b(f"{ENGINE}:{engine_model()}".encode(), digest_size=20)
+    second = SAMPLE_RATE * 2
+    if isinstance(wav, str):
+        with open(wav, 'rb') as wav_file:
+            data_offset = wav_data_offset(wav_file.read(65536))
+            remaining = ((os.path.getsize(wav) - data_offset) // second - 1) * second
+            wav_file.seek(data_offset)
+            while remaining > 0:
+                block = wav_file.read(min(remaining, 1 << 22))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+    else:
+        data_offset = wav_data_offset(wav)
+        hasher.update(memoryview(wav)[data_offset:data_offset + max(0, (len(wav) - data_offset) // second - 1) * second])
+    return hasher.hexdigest()
+
+def transcript_cache_path(fingerprint):
+    return os.path.join(TRANSCRIPT_CACHE_DIR, f"{fingerprint}.json.gz")
+
+def lookup_transcript_cache(episode):
+    # Fingerprint the decoded audio and, if the same audio was transcribed before, put the cached
+    # transcript in place so the episode can go straight to the upload. Without streaming this
+    # decodes the episode already, the transcribe stage then reuses the .wav.
+    if not TRANSCRIPT_CACHE_MAX_MB:
+        return False
+    audio_file = episode['episode_file']
+    try:
+        wav = episode.get('wav_data')
+        if wav is None:
+            wav = decode_audio_file(audio_file, episode)
+        with stage_timer("fingerprint"):
+            episode['fingerprint'] = audio_fingerprint(wav)
+        cache_path = transcript_cache_path(episode['fingerprint'])
+        hit = os.path.exists(cache_path)
+        if hit:
+            with gzip.open(cache_path, 'rt', encoding='utf-8') as cache_file:
+                entry = json.load(cache_file)
+            for extension in ("txt", "json", "srt"):
+                with open(f"{audio_file}.{extension}", 'w', encoding='utf-8') as output_file:
+                    output_file.write(entry[extension])
+            os.utime(cache_path)  # Mark as recently used
+    except (subprocess.CalledProcessError, OSError, ValueError, KeyError) as e:
+        logging.warning(f"Transcript cache lookup for episode {episode['guid']} failed: {e}")
+        return False
+
+    result = "hit" if hit else "miss"
+    transcript_cache_lookups[result] += 1
+    metric_inc("ppp_transcript_cache_total", result=result)
+    episode['stats']['transcript_cache'] = result
+    hit_rate = transcript_cache_lookups["hit"] / sum(transcript_cache_lookups.values())
+    logging.info(f"Transcript cache {result} for episode {episode['guid']} "
+                 f"(hit rate {hit_rate:.0%} over {sum(transcript_cache_lookups.values())} lookups)")
+    if not hit:
+        return False
+    wav_data = episode.pop('wav_data', None)
+    add_episode_stat("audio_seconds", (len(wav_data) if wav_data is not None else os.path.getsize(wav)) / (SAMPLE_RATE * 2))
+    episode['results'] = (f"{audio_file}.txt", f"{audio_file}.json", f"{audio_file}.srt")
+    episode['output_files'] = [audio_file, *episode['results'], f"{audio_file}.wav"]
+    journal_write(episode, "transcribed")
+    return True
+
+def store_transcript_cache(episode):
+    if not TRANSCRIPT_CACHE_MAX_MB or not episode.get('fingerprint'):
+        return
+    cache_path = transcript_cache_path(episode['fingerprint'])
+    try:
+        entry = {'guid': episode['guid'], 'model': engine_model()}
+        for extension, path in zip(("txt", "json", "srt"), episode['results']):
+            with open(path, encoding='utf-8', errors='replace') as result_file:
+                entry[extension] = result_file.read()
+        os.makedirs(TRANSCRIPT_CACHE_DIR, exist_ok=True)
+        with gzip.open(f"{cache_path}.tmp", 'wt', encoding='utf-8') as cache_file:
+            json.dump(entry, cache_file)
+        os.replace(f"{cache_path}.tmp", cache_path)
+        evict_lru(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024)
+    except OSError as e:
+        logging.warning(f"Could not store the transcript of episode {episode['guid']} in the cache: {e}")
+
+def download_episode(episode_url, output_path, guid=None):
+    cached_path = audio_cache_lookup(episode_url, guid)
+    if cached_path:
+        try:
+            link_or_copy(cached_path, output_path)
+            logging.info(f"Episode found in audio cache, linked to {output_path}")
+            return True
+        except OSError as e:
+            # Evicted by another worker in the meantime
+            logging.info(f"Could not take the episode from the audio cache ({e}), downloading it.")
+
     max_retries = 10
     retry_count = 0
+    part_path = f"{output_path}.part"
     
     while retry_count < max_retries:
+        if shutdown_event.is_set():
+            # The lease is handed back on the way out, don't start the download over during the grace period
+            cleanup_files([part_path])
+            return False
         logging.info(f"Attempting to download episode from {episode_url}...")
         try:
-            r = requests.get(episode_url, stream=True)
-            if r.status_code == 200 and 'audio' in r.headers.get('Content-Type', ''):
-                with open(output_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
+            # Resumes from the .part file if an earlier attempt got interrupted
+            total_size = download_range(episode_url, part_path, require_audio=True)
+            downloaded_size = os.path.getsize(part_path)
+            if total_size is None or downloaded_size == total_size:
+                os.replace(part_path, output_path)
                 logging.info(f"Episode downloaded to {output_path}")
-                return True
-            else:
-                logging.warning(f"Attempt {retry_count + 1}/{max_retries}: Download failed. Status code: {r.status_code}, Content-Type: {r.headers.get('Content-Type')}")
+                break
+            logging.warning(f"Attempt {retry_count + 1}/{max_retries}: Download incomplete. Got {downloaded_size} of {total_size} bytes")
+            if downloaded_size > total_size:
+                os.remove(part_path)
         except Exception as e:
             logging.error(f"Attempt {retry_count + 1}/{max_retries}: Error during download: {e}")
         
         if retry_count < max_retries - 1:
-            logging.info(f"Waiting 60 seconds before retry {retry_count + 2}...")
-            time.sleep(60)
+            wait_before_retry(retry_count, "download")
         retry_count += 1
-    
-    logging.error("Failed to download episode after maximum retries.")
-    return False
+    else:
+        logging.error("Failed to download episode after maximum retries.")
+        cleanup_files([part_path])
+        return False
+
+    if guid:
+        # The episode is downloaded either way, a cache problem must not count as a failed download
+        try:
+            audio_cache_store(episode_url, guid, output_path)
+        except OSError as e:
+            logging.warning(f"Could not store the episode in the audio cache: {e}")
+    return True
+
+def stream_decode_episode(episode_url, cached_path=None):
+    # Feed the HTTP response body straight into ffmpeg and collect the 16 kHz WAV it
+    # writes to stdout, so neither the .mp3 nor the .wav ever touches the disk.
+    # Audio that is already in the audio cache is decoded from there instead.
+    ffmpeg_args = ["-map_metadata", "-1", "-fflags", "+bitexact", "-f", "wav", "-acodec", "pcm_s16le", "-ac", "1", "-ar", "16000", "pipe:1"]
+    feed_errors = []
+    fed_bytes = [0]  # Counted by the feeder thread, recorded here since the episode stats belong to this thread
+    if cached_path:
+        logging.info(f"Decoding cached episode {cached_path} through ffmpeg...")
+        ffmpeg = subprocess.Popen(["ffmpeg", "-loglevel", "error", "-i", cached_path] + ffmpeg_args, stdout=subprocess.PIPE)
+        feeder = None
+    else:
+        logging.info(f"Streaming episode from {episode_url} through ffmpeg...")
+        r = http_session().get(episode_url, stream=True, timeout=HTTP_TIMEOUT)
+        if r.status_code != 200 or 'audio' not in r.headers.get('Content-Type', ''):
+            logging.warning(f"Streaming download failed. Status code: {r.status_code}, Content-Type: {r.headers.get('Content-Type')}")
+            r.close()
+            return None
 
-def execute(cmd):
-    popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+        ffmpeg = subprocess.Popen(["ffmpeg", "-loglevel", "error", "-i", "pipe:0"] + ffmpeg_args,
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        def feed_ffmpeg():
+            try:
+                for chunk in r.iter_content(chunk_size=65536):
+                    ffmpeg.stdin.write(chunk)
+                    fed_bytes[0] += len(chunk)
+            except BrokenPipeError:
+                pass  # ffmpeg exited early, its return code tells us why
+            except Exception as e:
+                feed_errors.append(e)
+            finally:
+                r.close()
+                try:
+                    ffmpeg.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        feeder = threading.Thread(target=feed_ffmpeg, daemon=True)
+        feeder.start()
+    wav_data = bytearray()
+    for chunk in iter(lambda: ffmpeg.stdout.read(1 << 20), b""):
+        wav_data += chunk
+    ffmpeg.stdout.close()
+    return_code = ffmpeg.wait()
+    if feeder:
+        feeder.join()
+        add_episode_stat("download_bytes", fed_bytes[0])
+        metric_inc("ppp_download_bytes_total", fed_bytes[0])
+
+    if feed_errors:
+        logging.warning(f"Error while streaming episode: {feed_errors[0]}")
+        return None
+    if return_code:
+        logging.warning(f"ffmpeg failed to decode the stream. Return code: {return_code}")
+        return None
+    fix_wav_header(wav_data)
+    logging.info(f"Decoded {len(wav_data) / 1e6:.0f} MB of audio ({len(wav_data) / 32000 / 60:.1f} minutes) in memory")
+    return wav_data
+
+def wav_data_offset(wav_header):
+    # Offset of the first sample, found by walking the RIFF chunks up to "data"
+    offset = 12
+    while offset + 8 <= len(wav_header):
+        chunk_id = bytes(wav_header[offset:offset + 4])
+        if chunk_id == b"data":
+            return offset + 8
+        chunk_size = struct.unpack_from("<I", wav_header, offset + 4)[0]
+        offset += 8 + chunk_size + (chunk_size & 1)
+    raise ValueError("No data chunk found in WAV header")
+
+def fix_wav_header(wav_data):
+    # ffmpeg can't seek back on a pipe, so the RIFF and data chunk sizes are left as placeholders
+    data_offset = wav_data_offset(wav_data)
+    struct.pack_into("<I", wav_data, 4, len(wav_data) - 8)
+    struct.pack_into("<I", wav_data, data_offset - 4, len(wav_data) - data_offset)
+
+# ffmpeg/whisper.cpp processes started by execute(), stopped when the worker shuts down
+running_processes = set()
+
+def execute(cmd, input_data=None, merge_stderr=False):
+    popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, stdin=subprocess.PIPE if input_data is not None else None,
+                             stderr=subprocess.STDOUT if merge_stderr else None, universal_newlines=True)
+    running_processes.add(popen)
+    if input_data is not None:
+        # Write stdin from a thread so a chatty process can't deadlock on a full stdout pipe
+        def feed_stdin():
+            try:
+                popen.stdin.buffer.write(input_data)
+                popen.stdin.close()
+            except BrokenPipeError:
+                pass
+        feeder = threading.Thread(target=feed_stdin, daemon=True)
+        feeder.start()
     for stdout_line in iter(popen.stdout.readline, ""):
         logging.info(stdout_line.strip())
+        # whisper.cpp reports how long loading the model took in its timings
+        load_time = re.search(r"load time =\s*([\d.]+) ms", stdout_line)
+        if load_time:
+            add_episode_stat("model_load_seconds", float(load_time.group(1)) / 1000)
+            metric_observe("ppp_model_load_seconds", float(load_time.group(1)) / 1000)
     popen.stdout.close()
     return_code = popen.wait()
+    running_processes.discard(popen)
     if return_code:
         raise subprocess.CalledProcessError(return_code, cmd)
 
-def process_audio_with_whisper_cpp(audio_file):
+def format_timestamp(ms):
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+def write_whisper_outputs(output_base, segments, language="en", model=None):
+    # Write txt/SRT/JSON in the same shape whisper.cpp's -otxt -osrt -oj produce,
+    # segments being (from_ms, to_ms, text) tuples
+    with open(f"{output_base}.txt", 'w') as txt_file:
+        for _, _, text in segments:
+            txt_file.write(f"{text}\n")
+    with open(f"{output_base}.srt", 'w') as srt_file:
+        for i, (from_ms, to_ms, text) in enumerate(segments):
+            srt_file.write(f"{i + 1}\n{format_timestamp(from_ms)} --> {format_timestamp(to_ms)}\n{text}\n\n")
+    with open(f"{output_base}.json", 'w') as json_file:
+        json.dump({
+            'params': {'model': model or MODEL_PATH, 'language': language, 'translate': False},
+            'result': {'language': language},
+            'transcription': [
+                {
+                    'timestamps': {'from': format_timestamp(from_ms), 'to': format_timestamp(to_ms)},
+                    'offsets': {'from': from_ms, 'to': to_ms},
+                    'text': text
+                }
+                for from_ms, to_ms, text in segments
+            ]
+        }, json_file, indent=2, ensure_ascii=False)
+
+# Resident whisper.cpp server, loaded once and reused for every episode
+whisper_server = None
+whisper_server_busy = threading.Lock()
+# Held while the server is checked or restarted, so threads that notice a crash at the same time start only one new server
+whisper_server_lock = threading.RLock()
+
+# The server reports the detected language by name, the CLI and the uploads use whisper's language codes
+WHISPER_LANGUAGE_CODES = {
+    "english": "en", "chinese": "zh", "german": "de", "spanish": "es", "russian": "ru", "korean": "ko", "french": "fr",
+    "japanese": "ja", "portuguese": "pt", "turkish": "tr", "polish": "pl", "catalan": "ca", "dutch": "nl", "arabic": "ar",
+    "swedish": "sv", "italian": "it", "indonesian": "id", "hindi": "hi", "finnish": "fi", "vietnamese": "vi", "hebrew": "he",
+    "ukrainian": "uk", "greek": "el", "malay": "ms", "czech": "cs", "romanian": "ro", "danish": "da", "hungarian": "hu",
+    "tamil": "ta", "norwegian": "no", "thai": "th", "urdu": "ur", "croatian": "hr", "bulgarian": "bg", "lithuanian": "lt",
+    "latin": "la", "maori": "mi", "malayalam": "ml", "welsh": "cy", "slovak": "sk", "telugu": "te", "persian": "fa",
+    "latvian": "lv", "bengali": "bn", "serbian": "sr", "azerbaijani": "az", "slovenian": "sl", "kannada": "kn", "estonian": "et",
+    "macedonian": "mk", "breton": "br", "basque": "eu", "icelandic": "is", "armenian": "hy", "nepali": "ne", "mongolian": "mn",
+    "bosnian": "bs", "kazakh": "kk", "albanian": "sq", "swahili": "sw", "galician": "gl", "marathi": "mr", "punjabi": "pa",
+    "sinhala": "si", "khmer": "km", "shona": "sn", "yoruba": "yo", "somali": "so", "afrikaans": "af", "occitan": "oc",
+    "georgian": "ka", "belarusian": "be", "tajik": "tg", "sindhi": "sd", "gujarati": "gu", "amharic": "am", "yiddish": "yi",
+    "lao": "lo", "uzbek": "uz", "faroese": "fo", "haitian creole": "ht", "pashto": "ps", "turkmen": "tk", "nynorsk": "nn",
+    "maltese": "mt", "sanskrit": "sa", "luxembourgish": "lb", "myanmar": "my", "tibetan": "bo", "tagalog": "tl",
+    "malagasy": "mg", "assamese": "as", "tatar": "tt", "hawaiian": "haw", "lingala": "ln", "hausa": "ha", "bashkir": "ba",
+    "javanese": "jw", "sundanese": "su", "cantonese": "yue",
+}
+
+def whisper_thread_args(threads=None):
+    threads = threads or WHISPER_THREADS
+    args = ["-t", str(threads)] if threads else []
+    if WHISPER_PROCESSORS:
+        args += ["-p", str(WHISPER_PROCESSORS)]
+    if WHISPER_BEAM_SIZE:
+        args += ["-bs", str(WHISPER_BEAM_SIZE)]
+    return args
+
+def log_process_output(popen):
+    for stdout_line in iter(popen.stdout.readline, ""):
+        logging.info(stdout_line.strip())
+    popen.stdout.close()
+
+def whisper_server_healthy():
+    try:
+        return http_session().get(WHISPER_SERVER_URL, timeout=5).status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+def start_whisper_server():
+    global whisper_server
+    with whisper_server_lock:
+        stop_whisper_server()
+        logging.info(f"Starting whisper.cpp server on port {WHISPER_SERVER_PORT} and loading {MODEL_PATH}...")
+        started_at = time.monotonic()
+        whisper_server = subprocess.Popen([WHISPER_SERVER_PATH, "-m", MODEL_PATH, "--host", "127.0.0.1", "--port", str(WHISPER_SERVER_PORT)] + whisper_thread_args(),
+                                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        threading.Thread(target=log_process_output, args=(whisper_server,), daemon=True).start()
+        while not whisper_server_healthy():
+            if whisper_server.poll() is not None:
+                raise RuntimeError(f"whisper.cpp server exited with code {whisper_server.returncode} while loading the model")
+            time.sleep(1)
+        metric_observe("ppp_model_load_seconds", time.monotonic() - started_at)
+        logging.info(f"whisper.cpp server ready after {time.monotonic() - started_at:.1f} seconds.")
+
+def stop_whisper_server():
+    global whisper_server
+    if whisper_server is not None and whisper_server.poll() is None:
+        logging.info("Stopping whisper.cpp server...")
+        whisper_server.terminate()
+        try:
+            whisper_server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            whisper_server.kill()
+    whisper_server = None
+
+atexit.register(stop_whisper_server)
+
+def ensure_whisper_server():
+    # Checked under the lock, a thread that waited here finds the server another thread just restarted
+    with whisper_server_lock:
+        if whisper_server is None:
+            start_whisper_server()
+        elif whisper_server.poll() is not None:
+            logging.warning(f"whisper.cpp server exited with code {whisper_server.returncode}. Restarting...")
+            start_whisper_server()
+        elif not whisper_server_healthy():
+            logging.warning("whisper.cpp server is not responding. Restarting...")
+            start_whisper_server()
+
+def transcribe_with_whisper_cpp(wav, output_base, threads=None):
+    # wav is either the path of a 16 kHz WAV file or the decoded WAV bytes, which are piped to stdin
+    if isinstance(wav, str):
+        execute([WHISPER_CPP_PATH, "-f", wav, "-otxt", "-osrt", "-oj", "-of", output_base, "-m", MODEL_PATH] + whisper_thread_args(threads),
+                merge_stderr=True)
+    else:
+        execute([WHISPER_CPP_PATH, "-f", "-", "-otxt", "-osrt", "-oj", "-of", output_base, "-m", MODEL_PATH] + whisper_thread_args(threads),
+                input_data=wav, merge_stderr=True)
+
+def transcribe_with_whisper_server(wav, output_base, threads=None):
+    # wav is either the path of a 16 kHz WAV file or the decoded WAV bytes. The server's thread count is fixed at startup.
+    audio_seconds = (os.path.getsize(wav) if isinstance(wav, str) else len(wav)) / (SAMPLE_RATE * 2)
+    # The health check only runs between episodes, so a server that hangs mid-request is caught by this timeout
+    read_timeout = 300 + audio_seconds * WHISPER_SERVER_TIMEOUT_FACTOR
+    # The server transcribes one request at a time. Queueing here keeps the read timeout from running while a chunk waits its turn.
+    with whisper_server_busy:
+        max_retries = 2
+        for attempt in range(max_retries):
+            ensure_whisper_server()
+            try:
+                if isinstance(wav, str):
+                    with open(wav, 'rb') as wav_file:
+                        response = http_session().post(f"{WHISPER_SERVER_URL}/inference", files={'file': ('audio.wav', wav_file)},
+                                                 data={'response_format': 'verbose_json'}, timeout=(10, read_timeout))
+                else:
+                    response = http_session().post(f"{WHISPER_SERVER_URL}/inference", files={'file': ('audio.wav', bytes(wav))},
+                                             data={'response_format': 'verbose_json'}, timeout=(10, read_timeout))
+                response.raise_for_status()
+                break
+            except requests.exceptions.ReadTimeout:
+                # Trying the same audio again would most likely hang again, so give up on it after the restart
+                logging.warning(f"whisper.cpp server did not answer within {read_timeout:.0f} seconds. Restarting it...")
+                start_whisper_server()
+                raise RuntimeError(f"whisper.cpp server timed out after {read_timeout:.0f} seconds")
+            except requests.exceptions.ConnectionError as e:
+                # The server most likely crashed mid-episode, restart it and try once more
+                logging.warning(f"Attempt {attempt + 1}/{max_retries}: Lost connection to whisper.cpp server: {e}")
+                if attempt == max_retries - 1:
+                    raise
+
+    result = response.json()
+    if 'segments' not in result:
+        raise RuntimeError(f"whisper.cpp server returned no segments: {result.get('error', result)}")
+    segments = [(round(segment['start'] * 1000), round(segment['end'] * 1000), segment['text'])
+                for segment in result['segments']]
+    language = result.get('language', 'en')
+    write_whisper_outputs(output_base, segments, WHISPER_LANGUAGE_CODES.get(language, language))
+
+# faster-whisper model and batched pipeline, loaded once per worker
+faster_whisper_pipeline = None
+
+def load_faster_whisper():
+    global faster_whisper_pipeline
+    import ctranslate2  # Installed with faster-whisper
+    device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    compute_type = FASTER_WHISPER_COMPUTE_TYPE or ("float16" if device == "cuda" else "int8")
+    logging.info(f"Loading faster-whisper model {FASTER_WHISPER_MODEL} on {device} ({compute_type})...")
+    started_at = time.monotonic()
+    model = faster_whisper.WhisperModel(FASTER_WHISPER_MODEL, device=device, compute_type=compute_type,
+                                        cpu_threads=WHISPER_THREADS or CPU_COUNT, download_root=MODEL_DIR)
+    faster_whisper_pipeline = faster_whisper.BatchedInferencePipeline(model=model)
+    metric_observe("ppp_model_load_seconds", time.monotonic() - started_at)
+    logging.info(f"faster-whisper ready after {time.monotonic() - started_at:.1f} seconds.")
+
+def transcribe_with_faster_whisper(wav, output_base, threads=None):
+    # The 16 kHz PCM is handed over in memory as float32, VAD splits it into segments that are decoded in batches
+    if faster_whisper_pipeline is None:
+        load_faster_whisper()
+    audio = read_wav_samples(wav).astype(np.float32) / 32768
+    segments, info = faster_whisper_pipeline.transcribe(audio, batch_size=FASTER_WHISPER_BATCH_SIZE, beam_size=WHISPER_BEAM_SIZE or 5)
+    segments = [(round(segment.start * 1000), round(segment.end * 1000), segment.text) for segment in segments]
+    write_whisper_outputs(output_base, segments, info.language, FASTER_WHISPER_MODEL)
+
+# Voice activity detection works on 30 ms frames of the 16 kHz mono audio
+SAMPLE_RATE = 16000
+VAD_FRAME_SAMPLES = 480
+VAD_PAD_FRAMES = 8  # Keep ~0.25 s of silence around speech so no words get clipped
+
+def read_wav_samples(wav):
+    # Returns the int16 samples of a 16 kHz mono WAV, given as a file path or bytes.
+    # Files are memory-mapped so multi-hour episodes aren't loaded into RAM at once.
+    if isinstance(wav, str):
+        with open(wav, 'rb') as wav_file:
+            data_offset = wav_data_offset(wav_file.read(65536))
+        return np.memmap(wav, dtype='<i2', mode='r', offset=data_offset)
+    data_offset = wav_data_offset(wav)
+    return np.frombuffer(wav, dtype='<i2', offset=data_offset, count=(len(wav) - data_offset) // 2)
+
+def frame_levels_db(samples):
+    # RMS level of every VAD frame in dBFS, computed in blocks to bound memory use
+    frame_count = len(samples) // VAD_FRAME_SAMPLES
+    levels = np.empty(frame_count, dtype=np.float32)
+    block = 20000
+    for start in range(0, frame_count, block):
+        end = min(start + block, frame_count)
+        frames = np.asarray(samples[start * VAD_FRAME_SAMPLES:end * VAD_FRAME_SAMPLES], dtype=np.float32).reshape(-1, VAD_FRAME_SAMPLES)
+        levels[start:end] = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(levels / 32768 + 1e-10)
+
+def find_runs(mask):
+    # Start (inclusive) and end (exclusive) indices of every run of True values
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return edges[0::2], edges[1::2]
+
+def plan_chunks(levels_db, chunk_frames):
+    # Returns chunks as lists of (start_frame, end_frame) pieces. Long silences are left
+    # out completely, the remaining speech spans are split at short pauses and packed
+    # into chunks of up to chunk_frames.
+    frame_count = len(levels_db)
+    silent = levels_db < VAD_THRESHOLD_DB
+    silence_starts, silence_ends = find_runs(silent)
+    silence_lengths = silence_ends - silence_starts
+    long_silences = silence_lengths >= SKIP_SILENCE_SECONDS * SAMPLE_RATE / VAD_FRAME_SAMPLES
+    span_starts = np.concatenate(([0], silence_ends[long_silences]))
+    span_ends = np.concatenate((silence_starts[long_silences], [frame_count]))
+    keep = span_ends > span_starts
+    span_starts = np.maximum(span_starts[keep] - VAD_PAD_FRAMES, 0)
+    span_ends = np.minimum(span_ends[keep] + VAD_PAD_FRAMES, frame_count)
+
+    # Split over-long spans in the middle of the pause closest to the chunk size
+    pause_midpoints = (silence_starts + silence_ends)[silence_lengths >= VAD_PAD_FRAMES] // 2
+    pieces = []
+    for start, end in zip(span_starts.tolist(), span_ends.tolist()):
+        while end - start > chunk_frames:
+            candidates = pause_midpoints[(pause_midpoints > start) & (pause_midpoints <= start + chunk_frames)]
+            cut = int(candidates[-1]) if len(candidates) else start + chunk_frames
+            pieces.append((start, cut))
+            start = cut
+        pieces.append((start, end))
+
+    chunks = []
+    chunk_length = 0
+    for start, end in pieces:
+        if not chunks or chunk_length + end - start > chunk_frames:
+            chunks.append([])
+            chunk_length = 0
+        chunks[-1].append((start, end))
+        chunk_length += end - start
+    return chunks
+
+def chunk_wav_data(samples, pieces):
+    wav_buffer = io.BytesIO()
+    with wave.open(wav_buffer, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        for start, end in pieces:
+            wav_file.writeframes(np.ascontiguousarray(samples[start * VAD_FRAME_SAMPLES:end * VAD_FRAME_SAMPLES]).tobytes())
+    return wav_buffer.getvalue()
+
+# Transcription engines by ENGINE name. transcribe takes a 16 kHz mono WAV (file path or bytes) and writes
+# output_base.{txt,srt,json} in whisper.cpp's layout, start (if any) loads the model up front.
+ENGINES = {
+    "whisper.cpp": {'transcribe': transcribe_with_whisper_cpp, 'start': None},
+    "whisper.cpp-server": {'transcribe': transcribe_with_whisper_server, 'start': start_whisper_server},
+    "faster-whisper": {'transcribe': transcribe_with_faster_whisper, 'start': load_faster_whisper},
+}
+
+def transcribe_audio(wav, output_base, threads=None):
+    ENGINES[ENGINE]['transcribe'](wav, output_base, threads)
+
+def available_memory_bytes():
+    # MemAvailable, or what is left under the container's memory limit if that is lower
+    available = None
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/memory.max") as limit_file, open("/sys/fs/cgroup/memory.current") as current_file:
+            limit = limit_file.read().strip()
+            if limit != "max":
+                left = int(limit) - int(current_file.read())
+                available = left if available is None else min(available, left)
+    except (OSError, ValueError):
+        pass
+    return available
+
+def default_chunk_workers():
+    # A quarter of the cores. With the whisper.cpp CLI every chunk loads its own copy of the model,
+    # so only as many as fit into the available memory. The server transcribes one chunk at a time anyway.
+    if ENGINE == "whisper.cpp-server":
+        return 1
+    workers = max(1, CPU_COUNT // 4)
+    if ENGINE == "whisper.cpp" and os.path.exists(MODEL_PATH):
+        available = available_memory_bytes()
+        if available is not None:
+            fitting = max(1, available // (os.path.getsize(MODEL_PATH) + CHUNK_MEMORY_OVERHEAD))
+            if fitting < workers:
+                logging.info(f"Only {available / 1e9:.1f} GB of memory available, transcribing {fitting} chunks at once instead of {workers}.")
+                workers = fitting
+    return workers
+
+def transcribe_in_chunks(wav, output_base):
+    samples = read_wav_samples(wav)
+    levels_db = frame_levels_db(samples)
+    total_frames = len(levels_db)
+    speech_frames = int(np.count_nonzero(levels_db >= VAD_THRESHOLD_DB))
+    chunk_workers = CHUNK_WORKERS or default_chunk_workers()
+    # Make sure every worker gets a chunk, but don't go below a minute per chunk
+    chunk_seconds = min(CHUNK_SECONDS, max(60, speech_frames * VAD_FRAME_SAMPLES / SAMPLE_RATE / chunk_workers))
+    chunks = plan_chunks(levels_db, int(chunk_seconds * SAMPLE_RATE / VAD_FRAME_SAMPLES))
+    kept_frames = sum(end - start for pieces in chunks for start, end in pieces)
+    logging.info(f"Split {total_frames * VAD_FRAME_SAMPLES / SAMPLE_RATE / 60:.1f} minutes of audio into {len(chunks)} chunks, "
+                 f"skipping {(total_frames - kept_frames) * VAD_FRAME_SAMPLES / SAMPLE_RATE / 60:.1f} minutes of silence")
+
+    workers = min(chunk_workers, max(1, len(chunks)))
+    threads = max(1, (WHISPER_THREADS or CPU_COUNT) // workers)
+
+    def transcribe_chunk(index):
+        chunk_base = f"{output_base}.chunk{index}"
+        try:
+            transcribe_audio(chunk_wav_data(samples, chunks[index]), chunk_base, threads)
+            with open(f"{chunk_base}.json") as json_file:
+                transcription = json.load(json_file)['transcription']
+        finally:
+            cleanup_files([f"{chunk_base}.txt", f"{chunk_base}.json", f"{chunk_base}.srt"])
+
+        # Map chunk-local offsets back to the episode timeline, piece by piece
+        ms_per_frame = VAD_FRAME_SAMPLES * 1000 // SAMPLE_RATE
+        local_starts = []
+        global_starts = []
+        local_position = 0
+        for start, end in chunks[index]:
+            local_starts.append(local_position * ms_per_frame)
+            global_starts.append(start * ms_per_frame)
+            local_position += end - start
+
+        def to_global(local_ms):
+            piece = max(bisect.bisect_right(local_starts, local_ms) - 1, 0)
+            return global_starts[piece] + local_ms - local_starts[piece]
+
+        return [(to_global(segment['offsets']['from']), to_global(segment['offsets']['to']), segment['text'])
+                for segment in transcription]
+
+    logging.info(f"Transcribing {len(chunks)} chunks with {workers} workers and {threads} threads each...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        chunk_segments = list(executor.map(transcribe_chunk, range(len(chunks))))
+    write_whisper_outputs(output_base, [segment for segments in chunk_segments for segment in segments])
+
+def decode_audio_file(audio_file, episode=None):
+    # With an episode the finished decode is journaled, and a .wav decoded earlier (before a restart,
+    # or for the transcript cache) is reused
+    output_wav = f"{audio_file}.wav"
+    if episode is not None and episode.get('stage') == "decoded" and os.path.exists(output_wav):
+        logging.info(f"Reusing {output_wav} decoded earlier")
+        return output_wav
+    logging.info(f"Processing audio file {audio_file} with ffmpeg to .wav")
+    with stage_timer("decode"):
+        execute(["ffmpeg", "-y", "-i", audio_file, "-acodec", "pcm_s16le", "-ac", "1", "-ar", "16000", output_wav])
+    if episode is not None:
+        journal_write(episode, "decoded")
+    return output_wav
+
+def process_audio_with_whisper_cpp(audio_file, wav_data=None, episode=None):
+    # With wav_data the decoded audio is piped to whisper.cpp and audio_file only names the outputs
     output_txt = f"{audio_file}.txt"
     output_json = f"{audio_file}.json"
     output_srt = f"{audio_file}.srt"
     output_wav = f"{audio_file}.wav"
 
     try:
-        logging.info(f"Processing audio file {audio_file} with ffmpeg to .wav")
-        execute(["ffmpeg", "-i", audio_file, "-acodec", "pcm_s16le", "-ac", "1", "-ar", "16000", output_wav])
+        if wav_data is None:
+            decode_audio_file(audio_file, episode)
+        add_episode_stat("audio_seconds", (len(wav_data) if wav_data is not None else os.path.getsize(output_wav)) / (SAMPLE_RATE * 2))
 
-        logging.info(f"Processing audio file {output_wav} with whisper.cpp...")
-        execute([WHISPER_CPP_PATH, "-f", output_wav, "-otxt", "-osrt", "-oj", "-of", audio_file, "-m", MODEL_PATH])
+        wait_for_engine()
+        with stage_timer("transcribe"):
+            # faster-whisper already splits at silences and batches the pieces, chunking on top would only get in its way
+            if CHUNKED and ENGINE != "faster-whisper":
+                logging.info(f"Processing audio for {audio_file} in chunks...")
+                transcribe_in_chunks(output_wav if wav_data is None else wav_data, audio_file)
+            else:
+                logging.info(f"Processing {'streamed audio for ' + audio_file if wav_data is not None else output_wav} with {ENGINE}...")
+                transcribe_audio(output_wav if wav_data is None else wav_data, audio_file)
 
-        logging.info("whisper.cpp completed successfully.")
+        logging.info(f"{ENGINE} completed successfully.")
         return output_txt, output_json, output_srt, output_wav
     except subprocess.CalledProcessError as e:
         logging.error(f"Error running whisper.cpp or ffmpeg: {e}")
         return None, None, None, None
+    except (requests.exceptions.RequestException, RuntimeError) as e:
+        logging.error(f"Error transcribing with {ENGINE}: {e}")
+        return None, None, None, None
+    except (OSError, ValueError, KeyError) as e:
+        logging.error(f"Error reading the audio or whisper.cpp results: {e}")
+        return None, None, None, None
+
+def write_json_string(body, path):
+    # JSON-encode a text file into body chunk by chunk instead of reading it into memory at once
+    body.write('"')
+    with open(path, encoding='utf-8', errors='replace') as text_file:
+        for chunk in iter(lambda: text_file.read(1 << 20), ""):
+            body.write(json.encoder.encode_basestring_ascii(chunk)[1:-1])
+    body.write('"')
+
+def build_upload_body(txt_path, json_path, srt_path, guid, episode_token, nickname, podcast_name):
+    # Serialise the request body to disk once, so retries just stream the same file again
+    compression = UPLOAD_COMPRESSION
+    if compression == "zstd" and zstandard is None:
+        logging.warning("zstandard is not installed, compressing the upload with gzip instead.")
+        compression = "gzip"
+    body_path = f"{json_path}.upload" + {"gzip": ".gz", "zstd": ".zst"}.get(compression, "")
+
+    with open(body_path, 'wb') as raw_file:
+        if compression == "gzip":
+            compressed_file = gzip.GzipFile(fileobj=raw_file, mode='wb', compresslevel=6)
+        elif compression == "zstd":
+            compressed_file = zstandard.ZstdCompressor(level=6).stream_writer(raw_file, closefd=False)
+        else:
+            compressed_file = None
+        body = io.TextIOWrapper(compressed_file or raw_file, encoding='ascii')
+        body.write('{' + f'"guid": {json.dumps(guid)}, "token": {json.dumps(episode_token)}, "results": {{')
+        if not UPLOAD_JSON_ONLY:
+            body.write('"transcript": ')
+            write_json_string(body, txt_path)
+            body.write(', ')
+        body.write('"json_data": ')
+        write_json_string(body, json_path)
+        if not UPLOAD_JSON_ONLY:
+            body.write(', "srt_data": ')
+            write_json_string(body, srt_path)
+        body.write('}, ' + f'"nickname": {json.dumps(nickname)}, "podcast_name": {json.dumps(podcast_name)}' + '}')
+        body.flush()
+        body.detach()
+        if compressed_file:
+            compressed_file.close()
+
+    content_encoding = {"gzip": "gzip", "zstd": "zstd"}.get(compression)
+    return body_path, content_encoding
+
+def post_upload_body(body_path, content_encoding):
+    headers = {'Content-Type': 'application/json'}
+    if content_encoding:
+        headers['Content-Encoding'] = content_encoding
+    with open(body_path, 'rb') as body:
+        return http_session().post(UPLOAD_URL, data=body, headers=headers, timeout=HTTP_TIMEOUT)
 
 def send_results(txt_path, json_path, srt_path, guid, episode_token, processed_count, failed_count, nickname, podcast_name):
     logging.info(f"Sending results for episode with GUID {guid} to the API...")
-    result_data = {
-        'guid': guid,
-        'token': episode_token,
-        'results': {
-            'transcript': open(txt_path).read(),
-            'json_data': open(json_path).read(),
-            'srt_data': open(srt_path).read()
-        },
-        'nickname': nickname,
-        'podcast_name': podcast_name
-    }
+    body_path, content_encoding = build_upload_body(txt_path, json_path, srt_path, guid, episode_token, nickname, podcast_name)
     logging.info(f"Sending nickname: {nickname}, podcast_name: {podcast_name}")
+    logging.info(f"Upload body is {os.path.getsize(body_path) / 1e6:.2f} MB" + (f" ({content_encoding})" if content_encoding else ""))
+    add_episode_stat("upload_bytes", os.path.getsize(body_path))
 
     max_retries = 10
     retry_count = 0
     
-    while retry_count < max_retries:
-        try:
-            response = requests.post(UPLOAD_URL, json=result_data)
-            if response.status_code == 200:
-                processed_count += 1
-                logging.info(f"Results for episode with GUID {guid} successfully uploaded. Total successful uploads: {processed_count}")
-                return processed_count, failed_count
-            else:
-                logging.warning(f"Attempt {retry_count + 1}/{max_retries}: Failed to upload results. Status code: {response.status_code}")
-        except requests.exceptions.ConnectionError as e:
-            logging.warning(f"Attempt {retry_count + 1}/{max_retries}: Connection error occurred: {str(e)}")
-        except Exception as e:
-            logging.warning(f"Attempt {retry_count + 1}/{max_retries}: Unexpected error occurred: {str(e)}")
+    try:
+        while retry_count < max_retries:
+            try:
+                response = post_upload_body(body_path, content_encoding)
+                if response.status_code == 200:
+                    processed_count += 1
+                    logging.info(f"Results for episode with GUID {guid} successfully uploaded. Total successful uploads: {processed_count}")
+                    return processed_count, failed_count
+                else:
+                    logging.warning(f"Attempt {retry_count + 1}/{max_retries}: Failed to upload results. Status code: {response.status_code}")
+            except requests.exceptions.ConnectionError as e:
+                logging.warning(f"Attempt {retry_count + 1}/{max_retries}: Connection error occurred: {str(e)}")
+            except Exception as e:
+                logging.warning(f"Attempt {retry_count + 1}/{max_retries}: Unexpected error occurred: {str(e)}")
+            
+            if retry_count < max_retries - 1:  # Don't sleep after the last attempt
+                wait_before_retry(retry_count, "upload")
+            retry_count += 1
         
-        if retry_count < max_retries - 1:  # Don't sleep after the last attempt
-            logging.info(f"Waiting 60 seconds before retry {retry_count + 2}...")
-            time.sleep(60)
-        retry_count += 1
-    
-    # If we get here, all retries failed
-    failed_count += 1
-    logging.error(f"Failed to upload results for episode with GUID {guid} after {max_retries} attempts. Total failed uploads: {failed_count}")
+        # If we get here, all retries failed. Keep the body so the transcription isn't lost.
+        failed_count += 1
+        logging.error(f"Failed to upload results for episode with GUID {guid} after {max_retries} attempts. Total failed uploads: {failed_count}")
+        spool_upload(body_path)
+    finally:
+        cleanup_files([body_path])
     return processed_count, failed_count
 
 def cleanup_files(files):
@@ -207,31 +1445,811 @@ def cleanup_files(files):
             os.remove(file)
             logging.info(f"Deleted file: {file}")
 
+# Journal: one small JSON file per leased episode, rewritten atomically whenever a stage finishes
+journal_worker_id = 0
+released_guids = set()  # Handed back during shutdown, a download finishing afterwards must not journal them again
+active_guids = set()  # Being transcribed right now, only handed back if they don't finish within the grace period
+JOURNAL_KEYS = ('guid', 'token', 'token_created_at', 'leased_at', 'podcast_name', 'episode_title', 'file_url', 'episode_file', 'stage')
+
+def journal_path(guid):
+    return os.path.join(JOURNAL_DIR, f"{sanitize_filename(guid)}.json")
+
+def journal_write(episode, stage):
+    episode['stage'] = stage
+    if episode['guid'] in released_guids:
+        return
+    entry = {key: episode.get(key) for key in JOURNAL_KEYS}
+    entry['worker'] = journal_worker_id
+    path = journal_path(episode['guid'])
+    try:
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        with open(f"{path}.tmp", 'w') as journal_file:
+            json.dump(entry, journal_file)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        logging.warning(f"Could not write the journal for episode {episode['guid']}: {e}")
+
+def journal_remove(episode):
+    try:
+        os.remove(journal_path(episode['guid']))
+    except FileNotFoundError:
+        pass
+
+def read_journal():
+    # Journal entries of this worker. Worker 0 also takes over those of workers that no longer exist because WORKERS was lowered.
+    if not os.path.isdir(JOURNAL_DIR):
+        return []
+    episodes = []
+    for name in sorted(os.listdir(JOURNAL_DIR)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(JOURNAL_DIR, name)) as journal_file:
+                episode = json.load(journal_file)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable journal entry {name}: {e}")
+            continue
+        worker = episode.pop('worker', 0)
+        if worker == journal_worker_id or (journal_worker_id == 0 and worker >= WORKERS):
+            episodes.append(episode)
+    return episodes
+
+def recover_journal():
+    # Episodes this worker leased before a restart, checked against the files that actually survived
+    recovered = []
+    for episode in read_journal():
+        audio_file = episode['episode_file']
+        results = (f"{audio_file}.txt", f"{audio_file}.json", f"{audio_file}.srt")
+        if episode['stage'] == "transcribed" and not all(os.path.exists(path) for path in results):
+            episode['stage'] = "decoded"
+        if episode['stage'] == "decoded" and not os.path.exists(f"{audio_file}.wav"):
+            episode['stage'] = "downloaded"
+        if episode['stage'] == "downloaded" and not os.path.exists(audio_file):
+            episode['stage'] = "leased"
+        episode['stats'] = {'recovered_stage': episode['stage']}
+        if episode['stage'] == "transcribed":
+            episode['results'] = results
+            episode['output_files'] = [audio_file, *results, f"{audio_file}.wav"]
+        elif lease_remaining(episode) < LEASE_MARGIN_SECONDS:
+            # Transcripts are always worth uploading, but don't start work the API will have given to someone else
+            logging.warning(f"Lease for recovered episode {episode['guid']} runs out too soon. Dropping it.")
+            cleanup_files([audio_file, f"{audio_file}.part", f"{audio_file}.wav"])
+            journal_remove(episode)
+            write_episode_stats(episode, "lease_expired")
+            continue
+        logging.info(f"Recovered episode {episode['guid']} from the journal, resuming after stage '{episode['stage']}'")
+        recovered.append(episode)
+    return recovered
+
+def resume_episode(episode):
+    # Recovered episodes that never finished downloading continue where the download stopped
+    if episode['stage'] == "leased":
+        return fetch_audio(episode)
+    return episode
+
+# Upload spool: upload bodies the API didn't take, named after the episode with the encoding as suffix
+def spool_upload(body_path):
+    spool_path = os.path.join(SPOOL_DIR, os.path.basename(body_path))
+    try:
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        os.replace(body_path, spool_path)
+    except OSError as e:
+        logging.error(f"Could not keep {body_path} in the upload spool: {e}")
+        return
+    metric_inc("ppp_spooled_uploads_total")
+    logging.info(f"Kept the results in {spool_path}, they are sent again once the API is reachable.")
+
+def drain_upload_spool():
+    failures = 0
+    while True:
+        delay = SPOOL_CHECK_SECONDS
+        names = sorted(os.listdir(SPOOL_DIR)) if os.path.isdir(SPOOL_DIR) else []
+        for name in names:
+            spool_path = os.path.join(SPOOL_DIR, name)
+            content_encoding = {".gz": "gzip", ".zst": "zstd"}.get(os.path.splitext(name)[1])
+            try:
+                response = post_upload_body(spool_path, content_encoding)
+            except (OSError, requests.exceptions.RequestException) as e:
+                logging.warning(f"Spooled upload {name} failed: {e}")
+                response = None
+            if response is not None and response.status_code == 200:
+                logging.info(f"Spooled upload {name} delivered.")
+                metric_inc("ppp_spool_uploads_total", result="uploaded")
+                cleanup_files([spool_path])
+                failures = 0
+            elif response is not None and 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                # The API looked at the results and refused them, sending them again won't change that
+                logging.error(f"API rejected spooled upload {name} with status {response.status_code}. Dropping it.")
+                metric_inc("ppp_spool_uploads_total", result="rejected")
+                cleanup_files([spool_path])
+            else:
+                if response is not None:
+                    logging.warning(f"Spooled upload {name} failed with status {response.status_code}")
+                delay = backoff_delay(failures)
+                failures = min(failures + 1, 10)
+                logging.info(f"{len(names)} uploads spooled, trying again in {delay:.0f} seconds.")
+                break
+        time.sleep(delay)
+
+def release_lease(episode, reason):
+    # Hand the episode back so the API can give it to someone else now instead of after the lease runs out
+    try:
+        response = http_session().post(RELEASE_URL, json={'guid': episode['guid'], 'token': episode['token'], 'reason': reason},
+                                       timeout=(HTTP_TIMEOUT[0], 10))
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Could not release episode {episode['guid']}: {e}")
+        return False
+    if response.status_code == 200:
+        logging.info(f"Released episode {episode['guid']} ({reason}).")
+        metric_inc("ppp_released_leases_total", reason=reason)
+        return True
+    if response.status_code == 404:
+        logging.info(f"The API can't take episode {episode['guid']} back, it is reassigned when the lease runs out.")
+    else:
+        logging.warning(f"Releasing episode {episode['guid']} failed with status code {response.status_code}")
+    return False
+
+def release_unfinished_leases(keep=()):
+    # Everything short of a finished transcript is cheap to redo, so give it back rather than let it wait 12 hours.
+    # Transcripts stay in the journal and are uploaded on the next start.
+    for episode in read_journal():
+        if episode['stage'] != "transcribed" and episode['guid'] not in keep:
+            released_guids.add(episode['guid'])
+            release_lease(episode, "shutdown")
+            audio_file = episode['episode_file']
+            cleanup_files([audio_file, f"{audio_file}.part", f"{audio_file}.wav"])
+            journal_remove(episode)
+
+def probe_episode_duration(url):
+    # ffprobe only reads as much of the file as it needs to find the length.
+    # Without it, assume the Content-Length is 48 kbit/s audio. Most podcasts use a higher bitrate,
+    # so this rather overestimates the length than lets a long episode through.
+    try:
+        result = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", url],
+                                capture_output=True, text=True, timeout=30)
+        return float(result.stdout.strip())
+    except (OSError, subprocess.SubprocessError, ValueError):
+        pass
+    try:
+        response = http_session().head(url, allow_redirects=True, timeout=HTTP_TIMEOUT)
+        if response.status_code == 200 and response.headers.get('Content-Length', '').isdigit():
+            return int(response.headers['Content-Length']) / 6000
+    except requests.exceptions.RequestException:
+        pass
+    return None
+
+def fits_into_lease(episode, queued_seconds=0):
+    if not recent_rtf:
+        return True
+    duration = probe_episode_duration(episode['file_url'])
+    if duration is None:
+        return True
+    # Be pessimistic and use the 75th percentile of the recent real-time factors
+    real_time_factor = sorted(recent_rtf)[len(recent_rtf) * 3 // 4]
+    needed = queued_seconds + duration * real_time_factor
+    available = lease_remaining(episode) - LEASE_MARGIN_SECONDS
+    add_episode_stat("estimated_transcribe_time", needed)
+    if needed <= available:
+        return True
+    logging.warning(f"Episode {episode['guid']} has {duration / 60:.0f} minutes of audio and would need about {needed / 3600:.1f} hours "
+                    f"at real-time factor {real_time_factor:.2f}, but only {available / 3600:.1f} hours of its lease are left.")
+    return False
+
+releases_in_a_row = 0
+too_long_guids = set()  # Released because they wouldn't fit into their lease, handed back unprobed if the API offers them again
+
+def fetch_episode(queued_seconds=0):
+    global releases_in_a_row
+    stats = {}
+    stats_local.episode = stats
+    with stage_timer("lease"):
+        episode = request_episode()
+    if not episode:
+        return None
+    mark_startup("first_lease")
+    episode['stats'] = stats
+    # Generate a sanitized filename for the episode
+    sanitized_guid = sanitize_filename(episode['guid'])
+    episode['episode_file'] = f"output/episode_{sanitized_guid}.mp3"
+    # Journaled before probing its length, so a shutdown in the meantime hands it back too
+    journal_write(episode, "leased")
+    if episode['guid'] in too_long_guids:
+        # The API offered it again instead of something else, give it back and ask again after a short pause
+        logging.info(f"Episode {episode['guid']} was already found too long for this host.")
+        release_lease(episode, "too_long")
+        journal_remove(episode)
+        write_episode_stats(episode, "released_too_long")
+        shutdown_event.wait(backoff_delay(0))
+        return None
+    if not fits_into_lease(episode, queued_seconds):
+        too_long_guids.add(episode['guid'])
+        release_lease(episode, "too_long")
+        journal_remove(episode)
+        write_episode_stats(episode, "released_too_long")
+        # Wait longer each time in case the API only has long episodes left
+        delay = backoff_delay(releases_in_a_row)
+        releases_in_a_row = min(releases_in_a_row + 1, 10)
+        logging.info(f"Waiting {delay:.0f} seconds before asking for another episode...")
+        shutdown_event.wait(delay)
+        return None
+    releases_in_a_row = 0
+    return fetch_audio(episode)
+
+def fetch_audio(episode):
+    stats_local.episode = episode['stats']
+    guid = episode['guid']
+    if guid in released_guids:
+        # Handed back by a shutdown while its length was probed
+        return None
+    if STREAMING:
+        try:
+            with stage_timer("stream_decode"):
+                episode['wav_data'] = stream_decode_episode(episode['file_url'], audio_cache_lookup(episode['file_url'], guid))
+        except Exception as e:
+            logging.warning(f"Error while streaming episode {guid}: {e}")
+            episode['wav_data'] = None
+        if episode['wav_data'] is not None:
+            mark_startup("first_audio")
+            lookup_transcript_cache(episode)
+            return episode
+        logging.info("Falling back to downloading the episode file...")
+
+    with stage_timer("download"):
+        downloaded = download_episode(episode['file_url'], episode['episode_file'], guid)
+    if guid in released_guids:
+        # Handed back by a shutdown while downloading, nothing tracks these files anymore
+        cleanup_files([episode['episode_file'], f"{episode['episode_file']}.part"])
+        return None
+    if not downloaded:
+        logging.info(f"Skipping episode {guid} due to download failure.")
+        cleanup_files([episode['episode_file']])
+        journal_remove(episode)
+        write_episode_stats(episode, "download_failed")
+        return None
+    journal_write(episode, "downloaded")
+    mark_startup("first_audio")
+    lookup_transcript_cache(episode)
+    return episode
+
+def transcribe_episode(episode):
+    stats_local.episode = episode['stats']
+    active_guids.add(episode['guid'])
+    try:
+        txt_path, json_path, srt_path, wav_path = process_audio_with_whisper_cpp(episode['episode_file'], episode.pop('wav_data', None), episode)
+    finally:
+        active_guids.discard(episode['guid'])
+    episode['output_files'] = [episode['episode_file'], txt_path, json_path, srt_path, wav_path]
+    if txt_path is None and shutdown_event.is_set():
+        # Most likely whisper.cpp got the signal too, the lease is handed back on the way out
+        return False
+    if txt_path is None:
+        logging.info(f"Skipping episode {episode['guid']} due to processing error.")
+        cleanup_files([episode['episode_file'], f"{episode['episode_file']}.wav"])
+        journal_remove(episode)
+        write_episode_stats(episode, "transcribe_failed")
+        return False
+    episode['results'] = (txt_path, json_path, srt_path)
+    journal_write(episode, "transcribed")
+    store_transcript_cache(episode)
+    return True
+
+def upload_episode(episode, processed_count, failed_count):
+    stats_local.episode = episode['stats']
+    txt_path, json_path, srt_path = episode['results']
+    # Send the results to the API and log upload success or failure
+    previous_processed_count, previous_failed_count = processed_count, failed_count
+    with stage_timer("upload"):
+        processed_count, failed_count = send_results(txt_path, json_path, srt_path, episode['guid'], episode['token'], processed_count, failed_count, nickname, episode['podcast_name'])
+    if shared_tally is not None:
+        add_to_shared_tally(processed_count - previous_processed_count, failed_count - previous_failed_count)
+    write_episode_stats(episode, "uploaded" if processed_count > previous_processed_count else "upload_spooled")
+
+    # Delivered or spooled, either way the results no longer depend on the files
+    cleanup_files(episode['output_files'])
+    journal_remove(episode)
+    return processed_count, failed_count
+
 def process_episode():
     processed_count = 0
     failed_count = 0
+    recovered = recover_journal()
 
-    while True:
-        episode_url, guid, episode_token, podcast_name = request_episode()
-        if not episode_url:
+    while not shutdown_event.is_set():
+        episode = resume_episode(recovered.pop(0)) if recovered else fetch_episode()
+        if not episode or shutdown_event.is_set():
             continue
-        # Generate a sanitized filename for the episode
-        sanitized_guid = sanitize_filename(guid)
-        episode_file = f"output/episode_{sanitized_guid}.mp3"
 
-        if not download_episode(episode_url, episode_file):
-            logging.info(f"Skipping episode {guid} due to download failure.")
+        if episode['stage'] != "transcribed" and not transcribe_episode(episode):
             continue
 
-        txt_path, json_path, srt_path, wav_path = process_audio_with_whisper_cpp(episode_file)
-        if txt_path is None:
-            logging.info(f"Skipping episode {guid} due to processing error.")
-            continue
+        processed_count, failed_count = upload_episode(episode, processed_count, failed_count)
+
+# Busy seconds per pipeline stage, used to report utilisation
+stage_busy = {"fetch": 0.0, "transcribe": 0.0, "upload": 0.0}
+stage_busy_lock = threading.Lock()
+
+def add_stage_busy(stage, started_at):
+    with stage_busy_lock:
+        stage_busy[stage] += time.monotonic() - started_at
+
+def log_stage_utilisation(pipeline_started_at):
+    elapsed = max(time.monotonic() - pipeline_started_at, 1e-9)
+    with stage_busy_lock:
+        utilisation = ", ".join(f"{stage} {busy / elapsed:.0%}" for stage, busy in stage_busy.items())
+    logging.info(f"Stage utilisation over {elapsed / 60:.1f} minutes: {utilisation}")
+
+def run_pipeline():
+    # Downloaded episodes waiting for whisper.cpp. The semaphore caps how many leases
+    # we hold ahead of transcription, so prefetching never hoards episodes.
+    transcribe_queue = queue.Queue()
+    upload_queue = queue.Queue(maxsize=2)
+    prefetch_slots = threading.Semaphore(PREFETCH_DEPTH)
+    transcribe_seconds = collections.deque(maxlen=10)
+    pipeline_started_at = time.monotonic()
+    recovered = recover_journal()
+
+    def expected_wait():
+        # Rough time until a newly leased episode reaches whisper.cpp
+        if not transcribe_seconds:
+            return 0
+        average = sum(transcribe_seconds) / len(transcribe_seconds)
+        return (transcribe_queue.qsize() + 1) * average
+
+    def fetch_worker():
+        # Recovered transcripts go straight to the uploader, the other recovered episodes come before new leases
+        for episode in recovered:
+            if episode['stage'] == "transcribed":
+                upload_queue.put(episode)
+        pending = [episode for episode in recovered if episode['stage'] != "transcribed"]
+        while not shutdown_event.is_set():
+            prefetch_slots.acquire()
+            while expected_wait() > LEASE_SECONDS - LEASE_MARGIN_SECONDS and not shutdown_event.is_set():
+                logging.info("Prefetched episodes would not finish within the lease window. Waiting before leasing another...")
+                shutdown_event.wait(60)
+            started_at = time.monotonic()
+            try:
+                episode = resume_episode(pending.pop(0)) if pending else fetch_episode(expected_wait())
+            except Exception:
+                logging.exception("Unexpected error in fetch stage")
+                episode = None
+            add_stage_busy("fetch", started_at)
+            if shutdown_event.is_set():
+                # Stays in the journal and is handed back on the way out
+                break
+            if episode and episode['stage'] == "transcribed":
+                # Found in the transcript cache, nothing left for whisper.cpp
+                prefetch_slots.release()
+                upload_queue.put(episode)
+            elif episode:
+                episode['queued_at'] = time.monotonic()
+                transcribe_queue.put(episode)
+            else:
+                prefetch_slots.release()
+
+    def transcribe_worker():
+        while not shutdown_event.is_set():
+            try:
+                episode = transcribe_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if shutdown_event.is_set():
+                break
+            prefetch_slots.release()
+            episode['stats']['queue_wait_seconds'] = time.monotonic() - episode.pop('queued_at')
+            remaining = lease_remaining(episode)
+            if remaining < LEASE_MARGIN_SECONDS:
+                logging.warning(f"Lease for episode {episode['guid']} expires in {remaining / 60:.0f} minutes. Dropping it.")
+                # The fetch stage may have decoded it already for the transcript cache
+                cleanup_files([episode['episode_file'], f"{episode['episode_file']}.wav"])
+                journal_remove(episode)
+                write_episode_stats(episode, "lease_expired")
+                continue
+            started_at = time.monotonic()
+            try:
+                transcribed = transcribe_episode(episode)
+            except Exception:
+                logging.exception(f"Unexpected error in transcribe stage for episode {episode['guid']}")
+                transcribed = False
+            add_stage_busy("transcribe", started_at)
+            if transcribed:
+                transcribe_seconds.append(time.monotonic() - started_at)
+                upload_queue.put(episode)
+        # Tell the uploader to stop once everything transcribed is uploaded
+        upload_queue.put(None)
+
+    def upload_worker():
+        processed_count = 0
+        failed_count = 0
+        while True:
+            episode = upload_queue.get()
+            if episode is None:
+                break
+            started_at = time.monotonic()
+            try:
+                processed_count, failed_count = upload_episode(episode, processed_count, failed_count)
+            except Exception:
+                logging.exception(f"Unexpected error in upload stage for episode {episode['guid']}")
+            add_stage_busy("upload", started_at)
+            log_stage_utilisation(pipeline_started_at)
+
+    logging.info(f"Starting pipeline mode with prefetch depth {PREFETCH_DEPTH}")
+    workers = [threading.Thread(target=worker, name=worker.__name__, daemon=True)
+               for worker in (fetch_worker, transcribe_worker, upload_worker)]
+    for worker in workers:
+        worker.start()
+    # The fetch thread may sit in a download during a shutdown, what it holds is in the journal
+    for worker in workers[1:]:
+        worker.join()
+
+# Counters shared by all workers in multi-worker mode
+shared_tally = None
+
+def add_to_shared_tally(processed, failed):
+    with shared_tally['processed'].get_lock():
+        shared_tally['processed'].value += processed
+    with shared_tally['failed'].get_lock():
+        shared_tally['failed'].value += failed
+    logging.info(f"All workers: {shared_tally['processed'].value} successful uploads, {shared_tally['failed'].value} failed uploads")
+
+def count_gpus():
+    try:
+        output = subprocess.run(["nvidia-smi", "-L"], capture_output=True, text=True, timeout=30).stdout
+    except (OSError, subprocess.SubprocessError):
+        return 0
+    return sum(1 for line in output.splitlines() if line.startswith("GPU "))
+
+# Calibration: time candidate whisper.cpp settings on a looped sample clip and keep the fastest good one
+def read_cpuinfo():
+    cpuinfo = {'model': None, 'flags': set(), 'cores': set()}
+    try:
+        with open("/proc/cpuinfo") as f:
+            physical_id = None
+            for line in f:
+                key, _, value = (part.strip() for part in line.partition(":"))
+                if key in ("model name", "Model") and not cpuinfo['model']:
+                    cpuinfo['model'] = value
+                elif key in ("flags", "Features"):
+                    cpuinfo['flags'].update(value.split())
+                elif key == "physical id":
+                    physical_id = value
+                elif key == "core id":
+                    cpuinfo['cores'].add((physical_id, value))
+    except OSError:
+        pass
+    return cpuinfo
+
+def detect_hardware():
+    cpuinfo = read_cpuinfo()
+    memory_mb = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    memory_mb = int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    try:
+        output = subprocess.run(["nvidia-smi", "--query-gpu=name,memory.total,compute_cap", "--format=csv,noheader"],
+                                capture_output=True, text=True, timeout=30).stdout
+        gpus = [line.strip() for line in output.splitlines() if line.strip()]
+    except (OSError, subprocess.SubprocessError):
+        gpus = []
+    simd = {"sse3", "ssse3", "avx", "avx2", "fma", "f16c", "avx512f", "avx512bw", "avx512_vnni", "avx_vnni",
+            "neon", "asimd", "asimdhp", "asimddp", "sve"}
+    return {'cpu': cpuinfo['model'], 'cpus': CPU_COUNT, 'physical_cores': min(len(cpuinfo['cores']), CPU_COUNT) or CPU_COUNT,
+            'simd': sorted(cpuinfo['flags'] & simd), 'memory_mb': memory_mb, 'gpus': gpus}
+
+def word_error_rate(reference, hypothesis):
+    reference_words = re.findall(r"[a-z0-9']+", reference.lower())
+    hypothesis_words = re.findall(r"[a-z0-9']+", hypothesis.lower())
+    if not reference_words:
+        return 0.0 if not hypothesis_words else 1.0
+    # Word level Levenshtein distance, one row at a time
+    previous = list(range(len(hypothesis_words) + 1))
+    for i, reference_word in enumerate(reference_words, 1):
+        current = [i]
+        for j, hypothesis_word in enumerate(hypothesis_words, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (reference_word != hypothesis_word)))
+        previous = current
+    return previous[-1] / len(reference_words)
 
-        # Send the results to the API and log upload success or failure
-        processed_count, failed_count = send_results(txt_path, json_path, srt_path, guid, episode_token, processed_count, failed_count, nickname, podcast_name)
+def run_calibration_candidate(clip, model_name, threads, processors, beam_size):
+    output_base = "output/calibration_run"
+    cmd = [WHISPER_CPP_PATH, "-m", os.path.join(MODEL_DIR, model_name), "-f", clip, "-otxt", "-of", output_base,
+           "-t", str(threads), "-p", str(processors)]
+    if beam_size:
+        cmd += ["-bs", str(beam_size)]
+    started_at = time.monotonic()
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=CALIBRATION_TIMEOUT)
+    seconds = time.monotonic() - started_at
+    if result.returncode:
+        raise subprocess.CalledProcessError(result.returncode, cmd)
+    load_time = re.search(r"load time =\s*([\d.]+) ms", result.stdout + result.stderr)
+    load_seconds = float(load_time.group(1)) / 1000 if load_time else 0.0
+    with open(f"{output_base}.txt") as f:
+        text = f.read()
+    os.remove(f"{output_base}.txt")
+    # The resident server loads the model once, so only the transcription itself counts there
+    if ENGINE == "whisper.cpp-server":
+        seconds -= load_seconds
+    return {'model': model_name, 'threads': threads, 'processors': processors, 'beam_size': beam_size,
+            'seconds': round(seconds, 3), 'load_seconds': round(load_seconds, 3), 'text': text}
 
-        cleanup_files([episode_file, txt_path, json_path, srt_path, wav_path])
+def describe_profile(profile):
+    return (f"{profile['model']}, {profile['threads']} threads, {profile['processors']} processors, "
+            f"beam size {profile['beam_size'] or 'default'}")
+
+def calibrate():
+    if ENGINE == "faster-whisper":
+        logging.info("Calibration only covers whisper.cpp, running faster-whisper with its settings as given.")
+        return None
+    hardware = detect_hardware()
+    threads_share = max(1, CPU_COUNT // WORKERS)
+    whisper_stat = os.stat(WHISPER_CPP_PATH) if os.path.exists(WHISPER_CPP_PATH) else None
+    # A profile is only reused on the same hardware, whisper.cpp build and settings
+    fingerprint = {'hardware': hardware, 'whisper_cpp': [whisper_stat.st_size, int(whisper_stat.st_mtime)] if whisper_stat else None,
+                   'model': MODEL_NAME, 'variants': CALIBRATION_MODELS, 'engine': ENGINE, 'workers': WORKERS, 'clip': CALIBRATION_CLIP,
+                   'max_wer': CALIBRATION_MAX_WER, 'fixed': [WHISPER_THREADS, WHISPER_PROCESSORS, WHISPER_BEAM_SIZE]}
+    if not RECALIBRATE and os.path.exists(CALIBRATION_FILE):
+        try:
+            with open(CALIBRATION_FILE) as f:
+                cached = json.load(f)
+            if cached.get('fingerprint') == fingerprint:
+                logging.info(f"Using the calibration profile from {cached['calibrated_at']}: {describe_profile(cached['profile'])}")
+                return cached['profile']
+            logging.info("Hardware or settings changed since the last calibration, calibrating again.")
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Could not read {CALIBRATION_FILE}: {e}")
+    if whisper_stat is None or not os.path.exists(CALIBRATION_CLIP):
+        logging.warning(f"Calibration needs {WHISPER_CPP_PATH} and {CALIBRATION_CLIP}, running with the default settings.")
+        return None
+
+    download_model(MODEL_NAME)
+    logging.info(f"Calibrating whisper.cpp for {hardware['cpu']} ({hardware['cpus']} CPUs, {hardware['memory_mb']} MB, "
+                 f"SIMD: {' '.join(hardware['simd']) or 'none'}, GPUs: {', '.join(hardware['gpus']) or 'none'})...")
+    clip = "output/calibration.wav"
+    try:
+        subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-stream_loop", str(CALIBRATION_LOOPS - 1), "-i", CALIBRATION_CLIP,
+                        "-ac", "1", "-ar", "16000", "-acodec", "pcm_s16le", clip], check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.warning(f"Could not prepare the calibration clip: {e}. Running with the default settings.")
+        return None
+
+    # Threads: our share of the cores, the physical cores, half of them, and 4 (plenty when a GPU does the work).
+    # Splitting the audio over processors only pays off on CPUs with enough cores and memory for the extra states.
+    physical_share = max(1, hardware['physical_cores'] // WORKERS)
+    thread_options = [WHISPER_THREADS] if WHISPER_THREADS else sorted(
+        {threads_share, min(physical_share, threads_share), max(1, threads_share // 2), min(4, threads_share)}, reverse=True)
+    if WHISPER_PROCESSORS:
+        processor_options = [WHISPER_PROCESSORS]
+    elif not hardware['gpus'] and threads_share >= 8 and (hardware['memory_mb'] or 0) >= 8000:
+        processor_options = [1, 2]
+    else:
+        processor_options = [1]
+    beam_options = [WHISPER_BEAM_SIZE] if WHISPER_BEAM_SIZE else [0, 1]  # 0 is whisper.cpp's default beam search, 1 greedy
+
+    candidates = []
+    reference = None
+
+    def measure(model_name, threads, processors, beam_size):
+        try:
+            result = run_calibration_candidate(clip, model_name, threads, processors, beam_size)
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.warning(f"Calibration run with {model_name}, -t {threads} -p {processors} -bs {beam_size} failed: {e}")
+            return None
+        result['wer'] = round(word_error_rate(reference, result['text']), 4) if reference is not None else 0.0
+        logging.info(f"Calibration: {describe_profile(result)}: {result['seconds']:.2f} s, WER {result['wer']:.3f}")
+        candidates.append(result)
+        return result
+
+    def fastest():
+        good = [candidate for candidate in candidates if candidate['wer'] <= CALIBRATION_MAX_WER]
+        return min(good, key=lambda candidate: candidate['seconds']) if good else None
+
+    # The default settings set the quality reference, the first run also warms the page cache
+    warm_up = measure(MODEL_NAME, thread_options[0], processor_options[0], beam_options[0])
+    if warm_up is None:
+        logging.warning("whisper.cpp failed on the calibration clip, running with the default settings.")
+        return None
+    reference = warm_up['text']
+    candidates.clear()
+
+    for threads in thread_options:
+        for processors in processor_options:
+            measure(MODEL_NAME, threads, processors, beam_options[0])
+    best = fastest() or warm_up
+    for beam_size in beam_options[1:]:
+        measure(MODEL_NAME, best['threads'], best['processors'], beam_size)
+    best = fastest() or best
+
+    base_name, extension = os.path.splitext(MODEL_NAME)
+    downloaded = []
+    for variant in CALIBRATION_MODELS:
+        variant_name = f"{base_name}-{variant}{extension}"
+        if not os.path.exists(os.path.join(MODEL_DIR, variant_name)):
+            try:
+                download_model(variant_name)
+            except Exception as e:
+                logging.warning(f"Skipping {variant_name} in the calibration: {e}")
+                continue
+            downloaded.append(variant_name)
+        measure(variant_name, best['threads'], best['processors'], best['beam_size'])
+    best = fastest() or best
+
+    # Quantised models that lost are removed again so they don't take up disk space
+    for variant_name in downloaded:
+        if variant_name != best['model']:
+            os.remove(os.path.join(MODEL_DIR, variant_name))
+    os.remove(clip)
+
+    profile = {key: best[key] for key in ('model', 'threads', 'processors', 'beam_size', 'seconds', 'wer')}
+    try:
+        with open(CALIBRATION_FILE, 'w') as f:
+            json.dump({'calibrated_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'fingerprint': fingerprint, 'profile': profile,
+                       'candidates': [{key: value for key, value in candidate.items() if key != 'text'} for candidate in candidates]}, f, indent=2)
+    except OSError as e:
+        logging.warning(f"Could not save the calibration profile: {e}")
+    logging.info(f"Calibration finished, using {describe_profile(profile)} ({profile['seconds']:.2f} s for the clip, WER {profile['wer']:.3f})")
+    return profile
+
+def apply_calibration_profile(profile):
+    global MODEL_NAME, MODEL_PATH, WHISPER_THREADS, WHISPER_PROCESSORS, WHISPER_BEAM_SIZE
+    if profile['model'] != MODEL_NAME:
+        download_model(profile['model'])
+    MODEL_NAME = profile['model']
+    MODEL_PATH = os.path.join(MODEL_DIR, MODEL_NAME)
+    WHISPER_THREADS = profile['threads']
+    WHISPER_PROCESSORS = profile['processors']
+    WHISPER_BEAM_SIZE = profile['beam_size']
+
+def request_shutdown(signum, frame):
+    if shutdown_event.is_set():
+        logging.info("Received a second signal, exiting now.")
+        exit(1)
+    logging.info(f"Received signal {signum}, shutting down...")
+    shutdown_event.set()
+
+def run_worker(metrics_port=METRICS_PORT):
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+    load_recent_rtf()
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    if journal_worker_id == 0:
+        # One drainer per container is enough, the spool is shared by all workers
+        threading.Thread(target=drain_upload_spool, name="upload_spool", daemon=True).start()
+    if ENGINE not in ENGINES:
+        logging.error(f"Unknown ENGINE {ENGINE}, choose one of {', '.join(ENGINES)}")
+        exit(1)
+    threading.Thread(target=warm_up_engine, name="warm_up", daemon=True).start()
+    # Episodes are processed in a thread, so the main thread can react to signals right away
+    episodes = threading.Thread(target=run_pipeline if PIPELINE else process_episode, name="episodes", daemon=True)
+    episodes.start()
+    while episodes.is_alive() and not shutdown_event.wait(1):
+        pass
+    if not shutdown_event.is_set():
+        logging.error("Episode processing stopped unexpectedly.")
+        exit(1)
+    if engine_failed:
+        logging.info("Handing back the episodes we hold, as there is nothing to transcribe them with...")
+
+    logging.info(f"Handing back episodes that haven't started and giving the current step {SHUTDOWN_GRACE_SECONDS} seconds to finish...")
+    release_unfinished_leases(keep=set(active_guids))
+    episodes.join(SHUTDOWN_GRACE_SECONDS)
+    for popen in list(running_processes):
+        popen.terminate()
+    release_unfinished_leases()
+    logging.info("Shutdown complete.")
+    if engine_failed:
+        exit(1)
+
+def worker_main(worker_id, cpus, gpu, tally):
+    global CPU_COUNT, WHISPER_THREADS, WHISPER_SERVER_PORT, WHISPER_SERVER_URL, shared_tally, whisper_server, journal_worker_id
+    # Own process group, so the supervisor can stop this worker together with its ffmpeg/whisper.cpp children
+    os.setpgrp()
+    signal.signal(signal.SIGTERM, request_shutdown)
+    setup_logging(f"output/podcast_transcriber.worker{worker_id}.log", f"worker{worker_id}")
+    shared_tally = tally
+    whisper_server = None
+    journal_worker_id = worker_id
+
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    CPU_COUNT = len(cpus)
+    if not WHISPER_THREADS:
+        WHISPER_THREADS = len(cpus)
+    if gpu is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(gpu)
+    WHISPER_SERVER_PORT += worker_id
+    WHISPER_SERVER_URL = f"http://127.0.0.1:{WHISPER_SERVER_PORT}"
+    logging.info(f"Worker {worker_id} started on CPUs {cpus} with {WHISPER_THREADS} whisper.cpp threads"
+                 + (f" and GPU {gpu}" if gpu is not None else ""))
+
+    try:
+        run_worker(METRICS_PORT + worker_id if METRICS_PORT else 0)
+    finally:
+        stop_whisper_server()
+
+def run_supervisor():
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+    gpu_count = count_gpus()
+    # Give every worker its own contiguous block of cores (shared round robin if there are more workers than cores)
+    cpu_groups = [group.tolist() or [cpus[i % len(cpus)]] for i, group in enumerate(np.array_split(cpus, WORKERS))]
+    tally = {'processed': multiprocessing.Value('i', 0), 'failed': multiprocessing.Value('i', 0)}
+    workers = {}
+    started_at = {}
+    quick_exits = {worker_id: 0 for worker_id in range(WORKERS)}
+    restart_at = {}  # Workers waiting out their restart backoff
+    stopping = threading.Event()
+
+    def start_worker(worker_id):
+        gpu = worker_id % gpu_count if gpu_count else None
+        worker = multiprocessing.Process(target=worker_main, args=(worker_id, cpu_groups[worker_id], gpu, tally), name=f"worker{worker_id}")
+        worker.start()
+        workers[worker_id] = worker
+        started_at[worker_id] = time.monotonic()
+
+    def request_stop(signum, frame):
+        logging.info(f"Received signal {signum}, stopping all workers...")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    logging.info(f"Starting {WORKERS} workers on {len(cpus)} CPUs and {gpu_count} GPUs")
+    for worker_id in range(WORKERS):
+        start_worker(worker_id)
+
+    while not stopping.wait(5):
+        for worker_id, worker in list(workers.items()):
+            if worker.is_alive():
+                continue
+            del workers[worker_id]
+            # Every worker leases (and hands back) an episode before its engine fails, so a broken setup must not restart them endlessly
+            if worker.exitcode == 1 and time.monotonic() - started_at[worker_id] < WORKER_QUICK_EXIT_SECONDS:
+                quick_exits[worker_id] += 1
+            else:
+                quick_exits[worker_id] = 0
+            if quick_exits[worker_id] >= WORKER_MAX_QUICK_EXITS:
+                logging.error(f"Worker {worker_id} failed {quick_exits[worker_id]} times right after starting. Not restarting it, check its log.")
+                continue
+            delay = backoff_delay(quick_exits[worker_id]) if quick_exits[worker_id] else 0
+            logging.warning(f"Worker {worker_id} exited with code {worker.exitcode}. Restarting it in {delay:.0f} seconds...")
+            restart_at[worker_id] = time.monotonic() + delay
+        for worker_id, due in list(restart_at.items()):
+            if time.monotonic() >= due:
+                del restart_at[worker_id]
+                start_worker(worker_id)
+        if not workers and not restart_at:
+            logging.error("All workers failed, stopping.")
+            break
+
+    # Only the workers get SIGTERM, they stop their own ffmpeg/whisper.cpp after handing back their leases
+    for worker in workers.values():
+        try:
+            os.kill(worker.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for worker in workers.values():
+        worker.join(timeout=SHUTDOWN_GRACE_SECONDS + 15)
+        if worker.is_alive():
+            os.killpg(worker.pid, signal.SIGKILL)
+            worker.join()
+    logging.info(f"All workers stopped. Successful uploads: {tally['processed'].value}, failed uploads: {tally['failed'].value}")
+    if not stopping.is_set():
+        exit(1)
 
 if __name__ == "__main__":
-    process_episode()
+    check_engine()
+    if CALIBRATE:
+        profile = calibrate()
+        if profile:
+            apply_calibration_profile(profile)
+    if WORKERS > 1:
+        # Download or verify the model once here, the workers then find it verified and only warm it up
+        if ENGINE != "faster-whisper":
+            download_model(MODEL_NAME)
+        run_supervisor()
+    else:
+        run_worker()